@@ -1,33 +1,28 @@
-import os
-import json
-import requests
-import iris
-from typing import List
-from requests.auth import HTTPBasicAuth
-from urllib.parse import urlencode
 import re
+from typing import List, Optional
 
-# === Configuration ===
-LMSTUDIO_API_BASE = "http://localhost:1234/v1"
-MODEL = "mistral-7b-instruct-v0.3"
-FHIR_BASE_URL = "http://127.0.0.1:8080/csp/healthshare/demo/fhir/r4"
-FHIR_AUTH = HTTPBasicAuth("_SYSTEM", "ISCDEMO")
+from lmstudio import chat_completion, chat_completion_echo
+from llmcache import LLM_CACHE_ENABLED, get_completion_cache
+from intent import is_general_question
 
 
-def call_mistral_with_messages(messages: List[dict]) -> str:
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "stream": False
-    }
-    response = requests.post(f"{LMSTUDIO_API_BASE}/chat/completions", headers=headers, json=payload)
-    if response.status_code == 200:
-        raw = response.json()["choices"][0]["message"]["content"]
-        return clean_mistral_response(raw)
+def call_mistral_with_messages(messages: List[dict], echo: Optional[str] = None, semantic: bool = False) -> str:
+    # With echo set, the answer is printed under that label as it is generated;
+    # generation stops as soon as the model starts an assistant marker.
+    # semantic lets a general question reuse the answer to a close paraphrase.
+    if echo:
+        raw = chat_completion_echo(messages, echo, stop_when=assistant_marker_start, semantic=semantic)
     else:
-        print("Error:", response.text)
-        return ""
+        raw = chat_completion(messages, stop_when=assistant_marker_start, semantic=semantic)
+    return clean_mistral_response(raw)
+
+
+ASSISTANT_MARKER_RE = re.compile(r"__\s*\(*assistant\)*\s*__", re.IGNORECASE)
+
+
+def assistant_marker_start(text: str) -> Optional[int]:
+    marker = ASSISTANT_MARKER_RE.search(text)
+    return marker.start() if marker else None
 
 
 def clean_mistral_response(text: str) -> str:
@@ -71,8 +66,11 @@ def main():
             {"role": "user", "content": user_question}
         ]
 
-        response = call_mistral_with_messages(messages)
-        print("\nMistral Response:", response)
+        # Questions about a patient are never matched by similarity ("John Smith's" / "Jane Doe's")
+        call_mistral_with_messages(messages, echo="\nMistral Response:", semantic=is_general_question(user_question))
+
+    if LLM_CACHE_ENABLED:
+        print("Completion cache:", get_completion_cache().stats())
 
 
 if __name__ == "__main__":
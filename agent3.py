@@ -1,79 +1,29 @@
-import os
 import json
-import requests
-import iris
-from typing import List
-from requests.auth import HTTPBasicAuth
-from urllib.parse import urlencode
 import re
+from typing import List, Optional
 
-# === Configuration ===
-LMSTUDIO_API_BASE = "http://localhost:1234/v1"
-MODEL = "mistral-7b-instruct-v0.3"
-FHIR_BASE_URL = "http://127.0.0.1:8080/csp/healthshare/demo/fhir/r4"
-FHIR_AUTH = HTTPBasicAuth("_SYSTEM", "ISCDEMO")
-
+from fhirclient import GetPatientByName, GetPatientSnapshot, USE_LOCAL_PATIENT_INDEX
+from lmstudio import chat_completion, chat_completion_echo
+from intent import resolve_patient_name, register_patient_names
 
 # === Tools ===
-def GetPatientByName(name: str):
-    print(f"[Tool] Looking up patient by name: {name}")
-    name_parts = name.strip().split()
-    last_name_fragment = ""
-    if len(name_parts) >= 1:
-        # Assume last name is the last word and extract first 4 alphanumeric characters
-        last_name_raw = name_parts[-1]
-        alphanum = re.sub(r"[^A-Za-z0-9]", "", last_name_raw)
-        last_name_fragment = alphanum[:4]
-
-    if not last_name_fragment:
-        print("No usable last name fragment found.")
-        return []
-
-    query_params = urlencode({"family:contains": last_name_fragment})
-    url = f"{FHIR_BASE_URL}/Patient?{query_params}"
-    print(f"[Debug] FHIR Patient URL: {url}")
-    headers = {
-        "Accept": "application/fhir+json",
-        "Content-Type": "application/fhir+json",
-        "Prefer": "return=representation"
-    }
-    response = requests.get(url, headers=headers, auth=FHIR_AUTH)
-    if response.status_code != 200:
-        print("FHIR Patient lookup failed:", response.status_code)
-        return []
-
-    bundle = response.json()
-    entries = bundle.get("entry", [])
-    patients = []
-    for e in entries:
-        resource = e.get("resource", {})
-        pid = resource.get("id")
-        gender = resource.get("gender", "unknown")
-        birth_date = resource.get("birthDate", "unknown")
-        names = resource.get("name", [])
-        display_name = "Unknown"
-        if names:
-            given = " ".join(names[0].get("given", []))
-            family = names[0].get("family", "")
-            display_name = f"{given} {family}".strip()
-        patients.append({
-            "id": pid,
-            "name": display_name,
-            "gender": gender,
-            "birthDate": birth_date
-        })
-
-    return patients
-
 def RetrievePatientData(patient_id: str):
-    # === STUB for now ===
-    print(f"[Stub] Retrieving data for patient ID: {patient_id}")
-    return f"(Simulated response for patient ID {patient_id}: allergies, conditions, immunizations...)"
+    # One bundled $everything request instead of a round trip per resource type
+    snapshot = GetPatientSnapshot(patient_id, include=("Immunization", "Condition", "Observation"))
+    if not snapshot:
+        return f"(No data could be retrieved for patient ID {patient_id})"
+    return json.dumps(snapshot, indent=2)
 
 
 # === Secondary Flow ===
 # === New: Ask Mistral to extract a patient name ===
 def detect_patient_name(user_question: str) -> str:
+    # Common phrasings are answered by the rule-based extractor; Mistral only
+    # sees the questions it is unsure about
+    return resolve_patient_name(user_question, fallback=detect_patient_name_with_mistral)
+
+
+def detect_patient_name_with_mistral(user_question: str) -> str:
     system_prompt = (
         "You are a helpful assistant. Determine if the following question refers to a specific patient. "
         "If it does, return only the full name of the patient (e.g., 'Susann Mann'). "
@@ -90,20 +40,22 @@ def detect_patient_name(user_question: str) -> str:
     return name
 
 
-def call_mistral_with_messages(messages: List[dict]) -> str:
-    headers = {"Content-Type": "application/json"}
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "stream": False
-    }
-    response = requests.post(f"{LMSTUDIO_API_BASE}/chat/completions", headers=headers, json=payload)
-    if response.status_code == 200:
-        raw = response.json()["choices"][0]["message"]["content"]
-        return clean_mistral_response(raw)
+def call_mistral_with_messages(messages: List[dict], echo: Optional[str] = None) -> str:
+    # With echo set, the answer is printed under that label as it is generated;
+    # generation stops as soon as the model starts an assistant marker.
+    if echo:
+        raw = chat_completion_echo(messages, echo, stop_when=assistant_marker_start)
     else:
-        print("Error:", response.text)
-        return ""
+        raw = chat_completion(messages, stop_when=assistant_marker_start)
+    return clean_mistral_response(raw)
+
+
+ASSISTANT_MARKER_RE = re.compile(r"__\s*\(*assistant\)*\s*__", re.IGNORECASE)
+
+
+def assistant_marker_start(text: str) -> Optional[int]:
+    marker = ASSISTANT_MARKER_RE.search(text)
+    return marker.start() if marker else None
 
 
 def clean_mistral_response(text: str) -> str:
@@ -115,6 +67,9 @@ def clean_mistral_response(text: str) -> str:
 # === Main Flow ===
 def main():
     print("\nWelcome to the Physician Assistant Agent!")
+    if USE_LOCAL_PATIENT_INDEX:
+        from patientindex import get_patient_index
+        register_patient_names(get_patient_index().names())
 
     assistant_role_setup = {
         "role": "assistant",
@@ -156,7 +111,7 @@ def main():
                     selected_patient = candidates[selection - 1]
                     print("\n[Patient Selected]", selected_patient["name"])
                     print(RetrievePatientData(selected_patient["id"]))
-                    continue  # Skip LLM for patient data stub
+                    continue  # Skip LLM for patient data
                 except (ValueError, IndexError):
                     print("Invalid selection. Skipping patient data retrieval.")
 
@@ -164,8 +119,7 @@ def main():
         messages = [assistant_role_setup] + example_conversation + [
             {"role": "user", "content": user_question}
         ]
-        response = call_mistral_with_messages(messages)
-        print("\nMistral Response:", response)
+        call_mistral_with_messages(messages, echo="\nMistral Response:")
 
 
 if __name__ == "__main__":
@@ -1,86 +1,24 @@
 # AGENT 5 (Fixed): Improved Autonomous Agent with Strict Step-by-Step Tool Execution
 
-import os
-import json
-import requests
 import re
-from typing import List, Dict, Any
-from requests.auth import HTTPBasicAuth
-from urllib.parse import urlencode
+from functools import partial
 
-# === Config ===
-LMSTUDIO_API_BASE = "http://localhost:1234/v1"
-MODEL = "mistral-7b-instruct-v0.3"
-FHIR_BASE_URL = "http://127.0.0.1:8080/csp/healthshare/demo/fhir/r4"
-FHIR_AUTH = HTTPBasicAuth("_SYSTEM", "ISCDEMO")
-
-# === Tools ===
-def GetPatientByName(name: str) -> Any:
-    print(f"[Tool] GetPatientByName: {name}")
-    name_parts = name.strip().split()
-    last_name_fragment = re.sub(r"[^A-Za-z0-9]", "", name_parts[-1])[:4] if name_parts else ""
-    query_params = urlencode({"family:contains": last_name_fragment})
-    url = f"{FHIR_BASE_URL}/Patient?{query_params}"
-    headers = {"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"}
-    response = requests.get(url, headers=headers, auth=FHIR_AUTH)
-    if response.status_code != 200:
-        return f"Error fetching patient: {response.status_code}"
-    bundle = response.json()
-    patients = []
-    for e in bundle.get("entry", []):
-        r = e["resource"]
-        name = r.get("name", [{}])[0]
-        display = f"{' '.join(name.get('given', []))} {name.get('family', '')}"
-        patients.append({"id": r.get("id"), "name": display.strip(), "dob": r.get("birthDate"), "gender": r.get("gender")})
-    return patients
-
-def GetAllImmunizations(patient_id: str) -> Any:
-    print(f"[Tool] GetAllImmunizations: {patient_id}")
-    query = urlencode({"patient": f"Patient/{patient_id}"})
-    url = f"{FHIR_BASE_URL}/Immunization?{query}"
-    headers = {"Accept": "application/fhir+json", "Content-Type": "application/fhir+json"}
-    response = requests.get(url, headers=headers, auth=FHIR_AUTH)
-    if response.status_code != 200:
-        return f"Error fetching immunizations: {response.status_code}"
-    results = []
-    for e in response.json().get("entry", []):
-        r = e["resource"]
-        code = next((c["code"] for c in r.get("vaccineCode", {}).get("coding", []) if c["system"] == "http://hl7.org/fhir/sid/cvx"), None)
-        results.append({
-            "cvx_code": code,
-            "description": r.get("vaccineCode", {}).get("text", ""),
-            "date": r.get("occurrenceDateTime", ""),
-            "status": r.get("status")
-        })
-    return results
+from fhirclient import GetPatientByName, GetAllImmunizations, GetPatientSnapshot, FHIR_CACHE_ENABLED, cache_stats
+from observations import compact_observation
+from prompts import few_shot_examples
+from toolcalling import run_tool_agent, AGENT_TOOL_MODE, AGENT_MAX_STEPS
+from lmstudio import react_step, FlatPrompt, DEBUG_PROMPT
 
 # === Tool registry ===
+# Failed lookups come back as "Error fetching ..." observations, not as empty results
 TOOLS = {
-    "GetPatientByName": GetPatientByName,
-    "GetAllImmunizations": GetAllImmunizations
+    "GetPatientByName": partial(GetPatientByName, report_errors=True),
+    "GetAllImmunizations": partial(GetAllImmunizations, report_errors=True),
+    "GetPatientSnapshot": partial(GetPatientSnapshot, report_errors=True)
 }
 
-# === Flattened prompt-style LLM call ===
-def call_mistral(messages: List[Dict[str, str]]) -> str:
-    prompt_lines = []
-    for m in messages:
-        prefix = "Instructions:" if m["role"] == "system" else m["role"].upper() + ":"
-        prompt_lines.append(f"{prefix} {m['content']}")
-    prompt_text = "\n\n".join(prompt_lines)
-    payload = {
-        "model": MODEL,
-        "messages": [{"role": "user", "content": prompt_text}],
-        "stream": False
-    }
-    response = requests.post(f"{LMSTUDIO_API_BASE}/chat/completions", headers={"Content-Type": "application/json"}, json=payload)
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        print("[Error] LLM call failed:", response.text)
-        return ""
-
 # === ReAct-style agent loop with enforced observation-wait ===
-def run_agent(user_question: str):
+def run_agent(user_question: str, debug: bool = DEBUG_PROMPT):
     devprompt = [{
         "role": "system",
         "content": (
@@ -96,29 +34,30 @@ def run_agent(user_question: str):
             "Do not assume tool results. Wait for an Observation before continuing your reasoning."
             " Available tools:\n"
             "- GetPatientByName: find patients in the FHIR server by name (string)\n"
-            "- GetAllImmunizations: get immunizations for a patient by FHIR ID (string)"
+            "- GetAllImmunizations: get immunizations for a patient by FHIR ID (string)\n"
+            "- GetPatientSnapshot: get a patient's demographics and immunizations in one call by FHIR ID (string)"
         )
     }]
 
-    few_shot = [
+    few_shot = few_shot_examples("agent5", [
         {"role": "user", "content": "Has John Smith been vaccinated for COVID?"},
         {"role": "assistant", "content": "Thought: I need to find John Smith in the patient records.\nAction: GetPatientByName\nAction Input: John Smith"},
         {"role": "user", "content": "Observation: [{\"id\": \"123\", \"name\": \"John Smith\"}]"},
         {"role": "assistant", "content": "Thought: I should now check immunizations.\nAction: GetAllImmunizations\nAction Input: 123"},
         {"role": "user", "content": "Observation: [{\"cvx_code\": \"208\", \"description\": \"COVID-19 mRNA\", \"date\": \"2022-02-01\"}]"},
         {"role": "assistant", "content": "Final Answer: Yes, John Smith has been vaccinated for COVID-19."}
-    ]
+    ])
 
     userprompt = {"role": "user", "content": user_question.strip()}
-    full_history = devprompt + few_shot + [userprompt]
+    prompt = FlatPrompt(devprompt + few_shot)
+    prompt.append(userprompt["role"], userprompt["content"])
 
-    for _ in range(6):
-        print("\n======== Full Prompt to Mistral ========")
-        for msg in full_history:
-            print(f"{msg['role'].upper()}: {msg['content']}\n")
+    for _ in range(AGENT_MAX_STEPS):
+        if debug:
+            print("\n======== Full Prompt to Mistral ========")
+            print(prompt.text)
 
-        response = call_mistral(full_history)
-        print("\n[Agent]", response)
+        response = react_step(prompt.text, list(TOOLS), echo="\n[Agent]")
 
         action_match = re.search(r"Action\s*:\s*(\w+)", response)
         input_match = re.search(r"Action Input\s*:\s*(.*)\n?", response)
@@ -131,8 +70,8 @@ def run_agent(user_question: str):
                 print(f"[Error] Unknown tool: {tool}")
                 break
             result = tool_fn(arg)
-            full_history.append({"role": "assistant", "content": response})
-            full_history.append({"role": "user", "content": f"Observation: {json.dumps(result, indent=2)}"})
+            prompt.append("assistant", response)
+            prompt.append("user", f"Observation: {compact_observation(result)}")
         else:
             if not response.strip():
                 print("\n[Final Answer] (No response from model)")
@@ -146,7 +85,13 @@ def main():
     while True:
         user_question = input("\nAsk your question (or type 'exit'): ")
         if user_question.lower() in ("exit", "quit"): break
-        run_agent(user_question)
+        if AGENT_TOOL_MODE:
+            run_tool_agent(user_question, TOOLS)
+        else:
+            run_agent(user_question)
+
+    if FHIR_CACHE_ENABLED:
+        print("FHIR cache:", cache_stats())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+# Non-interactive roster screening built on vaccineagent's pipeline.
+# Runs Steps 2-6 (patient lookup, CVX resolution, immunization fetch, match)
+# for every row of a CSV/JSONL roster with concurrent workers and no LLM calls.
+#
+#   python batchcheck.py roster.csv --disease measles --output results.jsonl
+
+import argparse
+import asyncio
+import csv
+import json
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+import httpx
+import requests
+
+from batchio import percentile, write_results
+from fhirasync import AsyncFHIRClient, FHIR_CONCURRENCY
+from fhirclient import USE_LOCAL_PATIENT_INDEX, last_name_fragment, summarize_patient, summarize_immunization
+from vaccineagent import GetVaccineCodes, matching_cvx_codes
+
+
+def read_roster(path: str) -> Iterator[Dict[str, str]]:
+    # CSV with a patient_id and/or patient_name column, or JSONL with the same keys
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+
+
+async def check_patient(fhir: AsyncFHIRClient, row: Dict[str, str], target_cvxs: set) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"input": row}
+    try:
+        patient_id = (row.get("patient_id") or "").strip()
+        # Step 2: Get patient (only needed when the roster has names instead of ids)
+        if not patient_id:
+            name = (row.get("patient_name") or "").strip()
+            if USE_LOCAL_PATIENT_INDEX:
+                from patientindex import search_patients
+                candidates = await asyncio.to_thread(search_patients, name, row.get("birth_date") or None)
+            else:
+                fragment = last_name_fragment(name)
+                candidates = [summarize_patient(r) for r in await fhir.search(
+                    "Patient", {"family:contains": fragment}, resource_type="Patient")] if fragment else []
+            # Step 3 without input(): keep exact full-name matches, otherwise report the ambiguity
+            exact = [p for p in candidates if p["name"].lower() == name.lower()]
+            matches = exact or candidates
+            if len(matches) != 1:
+                result["status"] = "not_found" if not matches else "ambiguous"
+                result["candidates"] = matches
+                return result
+            patient_id = matches[0]["id"]
+            result["patient_name"] = matches[0]["name"]
+        result["patient_id"] = patient_id
+
+        # Step 5: Get all immunizations
+        resources = await fhir.search("Immunization", {"patient": f"Patient/{patient_id}"}, resource_type="Immunization")
+        immunizations = [summarize_immunization(r) for r in resources]
+
+        # Step 6: Check for match
+        matching = matching_cvx_codes(immunizations, target_cvxs)
+        result["status"] = "vaccinated" if matching else "not_vaccinated"
+        result["matching_cvx_codes"] = matching
+        result["immunization_count"] = len(immunizations)
+    except (httpx.HTTPError, requests.RequestException) as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    finally:
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def run_batch(roster_path: str, disease: str, output_path: str, concurrency: int) -> Dict[str, Any]:
+    # Step 4: Resolve the disease to CVX codes once for the whole roster
+    codes = GetVaccineCodes(disease)
+    target_cvxs = {v["cvx_code"] for v in codes if "cvx_code" in v}
+    if not target_cvxs:
+        # Every patient would come out not_vaccinated: refuse rather than report that
+        errors = [v["error"] for v in codes if "error" in v]
+        raise ValueError(f"CVX lookup failed: {errors[0]}" if errors else f"No CVX codes found for: {disease}")
+
+    started = time.perf_counter()
+    latencies: List[float] = []
+
+    def on_result(result: Dict[str, Any]):
+        result["disease"] = disease
+        latencies.append(result["latency_ms"])
+
+    async with AsyncFHIRClient(concurrency=concurrency, verbose=False) as fhir:
+        tasks = [asyncio.create_task(check_patient(fhir, row, target_cvxs)) for row in read_roster(roster_path)]
+        statuses = await write_results(tasks, output_path, on_result)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "patients": len(latencies),
+        "elapsed_s": round(elapsed, 2),
+        "patients_per_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "max": max(latencies, default=0.0)
+        },
+        "statuses": statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a roster of patients for vaccination against one disease.")
+    parser.add_argument("roster", help="CSV or JSONL file with patient_id and/or patient_name (optional birth_date)")
+    parser.add_argument("--disease", required=True)
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=FHIR_CONCURRENCY)
+    args = parser.parse_args()
+
+    try:
+        stats = asyncio.run(run_batch(args.roster, args.disease, args.output, args.concurrency))
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
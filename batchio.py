@@ -0,0 +1,46 @@
+# Input and output shared by the batch modes (main.py --batch, webbatch.py,
+# batchcheck.py): line-per-item input files, JSONL result files written as
+# each task completes, and the latency percentiles of their reports.
+
+import asyncio
+import json
+import statistics
+import sys
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+def read_lines(path: str) -> List[str]:
+    # One item per line ("-" reads stdin); blank lines and # comments are skipped
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def write_results(tasks: Iterable[Awaitable[Dict[str, Any]]], output_path: str,
+                        on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, int]:
+    # Results are written as soon as each task completes, so an interrupted
+    # run keeps everything finished so far; returns the count per "status".
+    # on_result sees (and may extend) each result before it is written.
+    statuses: Dict[str, int] = {}
+    with open(output_path, "w", encoding="utf-8") as out:
+        for done in asyncio.as_completed(list(tasks)):
+            result = await done
+            if on_result:
+                on_result(result)
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    return statuses
+
+
+def percentile(values: List[float], pct: int) -> float:
+    # Linear interpolation between closest ranks (statistics "inclusive"),
+    # the one definition every batch report uses; pct is 1-99
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return round(values[0], 1)
+    return round(statistics.quantiles(values, n=100, method="inclusive")[pct - 1], 1)
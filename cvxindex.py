@@ -0,0 +1,141 @@
+# Process-wide CVX lookup service.
+# The CVX table is a few hundred rows, so it is loaded once (from
+# Cleaned_CVX_Data.csv or sql1.cvx_codes) into an inverted token index and
+# disease -> CVX resolution becomes a dictionary operation instead of a
+# connection handshake plus a LIKE scan per question.
+
+import csv
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+# === Configuration ===
+CVX_CSV_PATH = os.getenv("CVX_CSV_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "Cleaned_CVX_Data.csv"))
+CVX_SOURCE = os.getenv("CVX_SOURCE", "csv")  # "csv" or "iris"
+CVX_REFRESH_SECONDS = float(os.getenv("CVX_REFRESH_SECONDS", "0"))  # 0 disables background refresh
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall((text or "").lower())
+
+
+# === Loaders ===
+def load_from_csv(path: str = CVX_CSV_PATH) -> List[Dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [
+            {
+                "cvx_code": row["cvx_code"].strip(),
+                "short_description": row["short_description"],
+                "full_vaccine_name": row["full_vaccine_name"]
+            } for row in csv.DictReader(f)
+        ]
+
+
+def load_from_iris() -> List[Dict[str, str]]:
+    from irispool import get_pool
+
+    with get_pool().connection() as conn:
+        cursor = conn.execute("SELECT cvx_code, short_description, full_vaccine_name FROM sql1.cvx_codes")
+        return [
+            {
+                "cvx_code": str(row[0]),
+                "short_description": row[1],
+                "full_vaccine_name": row[2]
+            } for row in cursor.fetchall()
+        ]
+
+
+# === Index ===
+class CVXIndex:
+    def __init__(self, rows: List[Dict[str, str]]):
+        self.rows = rows
+        self.searchable = [f"{r['short_description'] or ''}\n{r['full_vaccine_name'] or ''}".lower() for r in rows]
+        self.postings: Dict[str, Set[int]] = {}
+        for i, text in enumerate(self.searchable):
+            for token in tokenize(text):
+                self.postings.setdefault(token, set()).add(i)
+        self.fragment_cache: Dict[str, Set[int]] = {}
+
+    def rows_for_token(self, token: str) -> Set[int]:
+        # Exact token hit is a dict lookup; partial words ("flu" -> "influenza")
+        # expand over the vocabulary once and are then memoized.
+        rows = self.fragment_cache.get(token)
+        if rows is None:
+            rows = set(self.postings.get(token, ()))
+            for vocab_token, ids in self.postings.items():
+                if token in vocab_token:
+                    rows |= ids
+            self.fragment_cache[token] = rows
+        return rows
+
+    def search(self, disease: str) -> List[Dict[str, str]]:
+        # Same matches as LOWER(short_description) LIKE '%x%' OR LOWER(full_vaccine_name) LIKE '%x%'
+        phrase = (disease or "").strip().lower()
+        tokens = tokenize(phrase)
+        if not tokens:
+            return []
+        candidates: Optional[Set[int]] = None
+        for token in tokens:
+            rows = self.rows_for_token(token)
+            candidates = rows if candidates is None else candidates & rows
+            if not candidates:
+                return []
+        return [
+            dict(self.rows[i]) for i in sorted(candidates)
+            if any(phrase in part for part in self.searchable[i].split("\n"))
+        ]
+
+
+# === Process-wide service ===
+_index: Optional[CVXIndex] = None
+_load_lock = threading.Lock()
+_refresher: Optional[threading.Thread] = None
+
+
+def load_rows(source: str = CVX_SOURCE) -> List[Dict[str, str]]:
+    if source == "iris":
+        try:
+            return load_from_iris()
+        except Exception as e:
+            print(f"[CVX] IRIS load failed, falling back to {CVX_CSV_PATH}: {e}")
+    return load_from_csv()
+
+
+def reload_cvx_index(source: str = CVX_SOURCE) -> CVXIndex:
+    # Build the new index off to the side and swap it in with one assignment,
+    # so concurrent searches always see a complete index.
+    global _index
+    index = CVXIndex(load_rows(source))
+    _index = index
+    return index
+
+
+def _refresh_loop(interval: float, source: str):
+    last_mtime = os.path.getmtime(CVX_CSV_PATH) if source == "csv" else None
+    while True:
+        time.sleep(interval)
+        try:
+            if source == "csv":
+                mtime = os.path.getmtime(CVX_CSV_PATH)
+                if mtime == last_mtime:
+                    continue
+                last_mtime = mtime
+            reload_cvx_index(source)
+        except Exception as e:
+            print(f"[CVX] Background refresh failed: {e}")
+
+
+def get_cvx_index() -> CVXIndex:
+    global _refresher
+    if _index is None:
+        with _load_lock:
+            if _index is None:
+                reload_cvx_index()
+            if CVX_REFRESH_SECONDS > 0 and _refresher is None:
+                _refresher = threading.Thread(target=_refresh_loop, args=(CVX_REFRESH_SECONDS, CVX_SOURCE), daemon=True)
+                _refresher.start()
+    return _index
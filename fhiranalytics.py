@@ -1,15 +1,142 @@
-import iris
+import argparse
+import os
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 
-# Connect to IRIS instance
-conn = iris.connect("127.0.0.1", 1972, "DEMO", "_SYSTEM", "ISCDEMO")
+import pandas as pd
 
-# Open a cursor and run SQL
-cursor = conn.cursor()
-cursor.execute("SELECT * FROM sql1.Patient")
+from irispool import get_pool
 
-# Fetch and print
-for row in cursor.fetchall():
-    print(row)
+ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", "5000"))
 
-cursor.close()
-conn.close()
\ No newline at end of file
+# cursor.description type codes (ODBC SQL types) -> Arrow type name
+SQL_ARROW_TYPES = {
+    -7: "bool", 16: "bool",
+    -6: "int64", 5: "int64", 4: "int64", -5: "int64",
+    6: "float64", 7: "float64", 8: "float64",
+    9: "date32", 91: "date32", 11: "timestamp", 93: "timestamp",
+    1: "string", 12: "string", -1: "string", -8: "string", -9: "string", -10: "string",
+}
+
+
+# === Streaming queries ===
+def iter_described_chunks(sql: str, params: Optional[Sequence[Any]] = None,
+                          chunk_size: int = ANALYTICS_CHUNK_SIZE) -> Iterator[Tuple[List[tuple], List[tuple]]]:
+    # Rows are pulled from the server with fetchmany, so at most one chunk is
+    # ever held in client memory, however large the table is.
+    with get_pool().connection() as conn:
+        cursor = conn.execute(sql, params)
+        description = [tuple(d) for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield description, [tuple(r) for r in rows]
+
+
+def iter_row_chunks(sql: str, params: Optional[Sequence[Any]] = None,
+                    chunk_size: int = ANALYTICS_CHUNK_SIZE) -> Iterator[Tuple[List[str], List[tuple]]]:
+    for description, rows in iter_described_chunks(sql, params, chunk_size):
+        yield [d[0] for d in description], rows
+
+
+def iter_dataframes(sql: str, params: Optional[Sequence[Any]] = None,
+                    chunk_size: int = ANALYTICS_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    for columns, rows in iter_row_chunks(sql, params, chunk_size):
+        yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def arrow_schema(pa, inferred, description: List[tuple]):
+    # The first chunk fixes the schema for every later one, so widen what that
+    # chunk cannot know: an all-NULL column takes its type from the cursor, an
+    # integer column that had NULLs (float in pandas) stays an integer, and
+    # decimals get room for any precision.
+    fields = []
+    for field, column in zip(inferred, description):
+        declared = SQL_ARROW_TYPES.get(column[1] if len(column) > 1 else None)
+        scale = column[5] if len(column) > 5 and isinstance(column[5], int) else 0
+        kind = field.type
+        if pa.types.is_null(kind):
+            if declared == "timestamp":
+                kind = pa.timestamp("us")
+            elif declared:
+                kind = getattr(pa, declared)()
+            elif column[1] in (2, 3):  # NUMERIC / DECIMAL
+                kind = pa.decimal128(38, scale)
+            else:
+                kind = pa.string()
+        elif pa.types.is_integer(kind) or (pa.types.is_floating(kind) and declared == "int64"):
+            kind = pa.int64()
+        elif pa.types.is_decimal(kind):
+            kind = pa.decimal128(38, max(kind.scale, scale))
+        fields.append(pa.field(field.name, kind))
+    return pa.schema(fields)
+
+
+def iter_record_batches(sql: str, params: Optional[Sequence[Any]] = None,
+                        chunk_size: int = ANALYTICS_CHUNK_SIZE):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Arrow output needs pyarrow: run 'uv sync --extra analytics'")
+
+    schema = None
+    for description, rows in iter_described_chunks(sql, params, chunk_size):
+        df = pd.DataFrame.from_records(rows, columns=[d[0] for d in description])
+        if schema is None:
+            inferred = pa.RecordBatch.from_pandas(df, preserve_index=False).schema
+            schema = arrow_schema(pa, inferred, description)
+        yield pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+# === Exports ===
+def export_csv(sql: str, path: str, params: Optional[Sequence[Any]] = None,
+               chunk_size: int = ANALYTICS_CHUNK_SIZE) -> int:
+    total = 0
+    for i, df in enumerate(iter_dataframes(sql, params, chunk_size)):
+        df.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        total += len(df)
+    return total
+
+
+def export_parquet(sql: str, path: str, params: Optional[Sequence[Any]] = None,
+                   chunk_size: int = ANALYTICS_CHUNK_SIZE) -> int:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output needs pyarrow: run 'uv sync --extra analytics'")
+
+    total = 0
+    writer = None
+    try:
+        for batch in iter_record_batches(sql, params, chunk_size):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_batch(batch)
+            total += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream an IRIS SQL query without loading the full result set.")
+    parser.add_argument("--query", default="SELECT * FROM sql1.Patient")
+    parser.add_argument("--chunk-size", type=int, default=ANALYTICS_CHUNK_SIZE)
+    parser.add_argument("--csv", help="write the result to this CSV file")
+    parser.add_argument("--parquet", help="write the result to this Parquet file")
+    args = parser.parse_args()
+
+    if args.csv:
+        print(f"Wrote {export_csv(args.query, args.csv, chunk_size=args.chunk_size)} rows to {args.csv}")
+    elif args.parquet:
+        print(f"Wrote {export_parquet(args.query, args.parquet, chunk_size=args.chunk_size)} rows to {args.parquet}")
+    else:
+        # Fetch and print, one chunk at a time
+        for _, rows in iter_row_chunks(args.query, chunk_size=args.chunk_size):
+            for row in rows:
+                print(row)
+
+
+if __name__ == "__main__":
+    main()
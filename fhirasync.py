@@ -0,0 +1,162 @@
+# Async version of the FHIR tools (httpx), for overlapping independent lookups
+# and checking whole cohorts of patients with bounded concurrency.
+
+import asyncio
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+import requests
+
+from fhircache import FHIR_CACHE_ENABLED, normalize_key, resource_type_of
+from fhirclient import (
+    FHIR_BASE_URL, FHIR_AUTH, FHIR_HEADERS, FHIR_POOL_SIZE, FHIR_CONNECT_TIMEOUT, FHIR_READ_TIMEOUT,
+    FHIR_MAX_RETRIES, FHIR_BACKOFF_FACTOR, FHIR_PAGE_SIZE, USE_LOCAL_PATIENT_INDEX, RESPONSE_CACHE,
+    fhir_url, next_link, summarize_patient, summarize_immunization, last_name_fragment
+)
+
+# === Configuration ===
+FHIR_CONCURRENCY = int(os.getenv("FHIR_CONCURRENCY", "10"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AsyncFHIRClient:
+    def __init__(self, concurrency: int = FHIR_CONCURRENCY, pool_size: int = FHIR_POOL_SIZE, verbose: bool = True,
+                 use_cache: bool = FHIR_CACHE_ENABLED):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.verbose = verbose
+        self.use_cache = use_cache
+        # Fewer connections than allowed requests would just queue inside httpx
+        pool_size = max(pool_size, concurrency)
+        self.client = httpx.AsyncClient(
+            base_url=FHIR_BASE_URL + "/",
+            auth=(FHIR_AUTH.username, FHIR_AUTH.password),
+            headers=FHIR_HEADERS,
+            timeout=httpx.Timeout(FHIR_READ_TIMEOUT, connect=FHIR_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        # The semaphore bounds in-flight requests, not whole tool calls, so a
+        # long paged search cannot starve the other patients in a cohort.
+        for attempt in range(FHIR_MAX_RETRIES + 1):
+            async with self.semaphore:
+                response = await self.client.get(url, params=params, headers=headers)
+            if response.status_code not in RETRY_STATUSES or attempt == FHIR_MAX_RETRIES:
+                break
+            await asyncio.sleep(FHIR_BACKOFF_FACTOR * (2 ** attempt))
+        return response
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       use_cache: bool = True) -> Dict[str, Any]:
+        # Same response cache as fhirclient.fhir_get_json, shared with the sync tools
+        if not (self.use_cache and use_cache):
+            response = await self.get(url, params)
+            response.raise_for_status()
+            return response.json()
+
+        url = fhir_url(url)
+        key = normalize_key(url, params)
+        ttl = RESPONSE_CACHE.ttl_for(resource_type_of(url, FHIR_BASE_URL))
+        cached = RESPONSE_CACHE.lookup(key)
+        headers = None
+        if cached:
+            body, etag, fresh = cached
+            if fresh:
+                return body
+            headers = {"If-None-Match": etag}
+
+        response = await self.get(url, params, headers)
+        if response.status_code == 304:
+            body = RESPONSE_CACHE.mark_revalidated(key, ttl)
+            if body is not None:
+                return body
+            response = await self.get(url, params)
+        elif cached:
+            RESPONSE_CACHE.mark_stale_miss()
+        response.raise_for_status()
+        body = response.json()
+        RESPONSE_CACHE.store(key, body, response.headers.get("ETag"), ttl)
+        return body
+
+    async def search(self, path: str, params: Optional[Dict[str, Any]] = None,
+                     count: Optional[int] = FHIR_PAGE_SIZE,
+                     resource_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        params = dict(params or {})
+        if count:
+            params["_count"] = count
+        url: Optional[str] = path
+        resources = []
+        while url:
+            # Like fhirclient.iter_bundle_entries, only the first page is cached
+            bundle = await self.get_json(url, params, use_cache=params is not None)
+            for entry in bundle.get("entry", []):
+                resource = entry.get("resource", {})
+                if resource_type and resource.get("resourceType") != resource_type:
+                    continue
+                resources.append(resource)
+            url = next_link(bundle)
+            params = None
+        return resources
+
+    # === Tools ===
+    async def get_patient_by_name(self, name: str, birth_date: Optional[str] = None) -> List[Dict[str, Any]]:
+        if self.verbose:
+            print(f"[Tool] GetPatientByName (async): {name}")
+        if USE_LOCAL_PATIENT_INDEX:
+            # The first call may build or refresh the index over blocking HTTP
+            from patientindex import search_patients
+            try:
+                return await asyncio.to_thread(search_patients, name, birth_date)
+            except requests.RequestException as e:
+                print("FHIR Patient lookup failed:", e)
+                return []
+        fragment = last_name_fragment(name)
+        if not fragment:
+            print("No usable last name fragment found.")
+            return []
+        try:
+            resources = await self.search("Patient", {"family:contains": fragment}, resource_type="Patient")
+        except httpx.HTTPError as e:
+            print("FHIR Patient lookup failed:", e)
+            return []
+        return [summarize_patient(r) for r in resources]
+
+    async def get_all_immunizations(self, patient_id: str) -> List[Dict[str, Any]]:
+        # Raises httpx.HTTPError: an empty list would read as "never vaccinated"
+        if self.verbose:
+            print(f"[Tool] GetAllImmunizations (async): {patient_id}")
+        params = {"patient": f"Patient/{patient_id.strip()}"}
+        resources = await self.search("Immunization", params, resource_type="Immunization")
+        return [summarize_immunization(r) for r in resources]
+
+    async def gather_immunizations(self, patient_ids: Iterable[str]) -> Dict[str, Any]:
+        # patient id -> immunizations, or {"error": ...} when that patient's lookup failed
+        patient_ids = list(patient_ids)
+        results = await asyncio.gather(*(self.get_all_immunizations(pid) for pid in patient_ids),
+                                       return_exceptions=True)
+        cohort: Dict[str, Any] = {}
+        for patient_id, result in zip(patient_ids, results):
+            if isinstance(result, httpx.HTTPError):
+                print(f"FHIR Immunization lookup failed for {patient_id}:", result)
+                result = {"error": str(result)}
+            elif isinstance(result, BaseException):
+                raise result
+            cohort[patient_id] = result
+        return cohort
+
+
+async def gather_immunizations(patient_ids: Iterable[str],
+                               concurrency: int = FHIR_CONCURRENCY) -> Dict[str, Any]:
+    async with AsyncFHIRClient(concurrency=concurrency) as fhir:
+        return await fhir.gather_immunizations(patient_ids)
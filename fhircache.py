@@ -0,0 +1,116 @@
+# Bounded TTL + LRU cache for FHIR responses, keyed by normalized query.
+# Expired entries that carry an ETag are kept so they can be revalidated with
+# If-None-Match instead of downloading the Bundle again.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# === Configuration ===
+FHIR_CACHE_ENABLED = os.getenv("FHIR_CACHE_ENABLED", "1") == "1"
+FHIR_CACHE_SIZE = int(os.getenv("FHIR_CACHE_SIZE", "512"))
+DEFAULT_TTL = float(os.getenv("FHIR_CACHE_TTL", "60"))
+
+# Seconds each resource type stays fresh; demographics change far less often than clinical data
+RESOURCE_TTLS = {
+    "Patient": 300.0,
+    "Immunization": 60.0,
+    "Observation": 30.0,
+    "Condition": 60.0,
+}
+
+
+def normalize_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(k, str(v).strip()) for k, v in params.items()]
+    query.sort()
+    return f"{parts.path.rstrip('/')}?{urlencode(query)}"
+
+
+def resource_type_of(url: str, base_url: str) -> str:
+    path = urlsplit(url).path
+    base_path = urlsplit(base_url).path.rstrip("/")
+    if path.startswith(base_path):
+        path = path[len(base_path):]
+    return path.strip("/").split("/")[0]
+
+
+class ResponseCache:
+    def __init__(self, max_size: int = FHIR_CACHE_SIZE, ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttls = dict(RESOURCE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.entries: "OrderedDict[str, Tuple[float, Optional[str], Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    def ttl_for(self, resource_type: str) -> float:
+        return self.ttls.get(resource_type, self.default_ttl)
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, Optional[str], bool]]:
+        # Returns (body, etag, fresh) or None. Stale entries are only returned
+        # when they have an ETag the caller can revalidate.
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, etag, body = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return body, etag, True
+            if etag is None:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            return body, etag, False
+
+    def store(self, key: str, body: Any, etag: Optional[str], ttl: float):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def mark_revalidated(self, key: str, ttl: float) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            _, etag, body = entry
+            self.entries[key] = (time.monotonic() + ttl, etag, body)
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.revalidated += 1
+            return body
+
+    def mark_stale_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
@@ -0,0 +1,384 @@
+# Shared FHIR client used by every agent's tools.
+# One pooled requests.Session is reused for the whole process so tool calls
+# keep their TCP connections (and basic-auth handshake) alive between calls.
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+from fhircache import ResponseCache, FHIR_CACHE_ENABLED, normalize_key, resource_type_of
+
+# === Configuration ===
+FHIR_BASE_URL = os.getenv("FHIR_BASE_URL", "http://127.0.0.1:8080/csp/healthshare/demo/fhir/r4")
+FHIR_AUTH = HTTPBasicAuth(os.getenv("FHIR_USERNAME", "_SYSTEM"), os.getenv("FHIR_PASSWORD", "ISCDEMO"))
+
+FHIR_POOL_SIZE = int(os.getenv("FHIR_POOL_SIZE", "10"))
+FHIR_CONNECT_TIMEOUT = float(os.getenv("FHIR_CONNECT_TIMEOUT", "5"))
+FHIR_READ_TIMEOUT = float(os.getenv("FHIR_READ_TIMEOUT", "30"))
+FHIR_MAX_RETRIES = int(os.getenv("FHIR_MAX_RETRIES", "3"))
+FHIR_BACKOFF_FACTOR = float(os.getenv("FHIR_BACKOFF_FACTOR", "0.5"))
+FHIR_PAGE_SIZE = int(os.getenv("FHIR_PAGE_SIZE", "100"))
+FHIR_SNAPSHOT_LIMIT = int(os.getenv("FHIR_SNAPSHOT_LIMIT", "32"))
+USE_LOCAL_PATIENT_INDEX = os.getenv("USE_LOCAL_PATIENT_INDEX", "0") == "1"  # see patientindex.py
+
+CVX_SYSTEM = "http://hl7.org/fhir/sid/cvx"
+
+FHIR_HEADERS = {
+    "Accept": "application/fhir+json",
+    "Content-Type": "application/fhir+json",
+    "Accept-Encoding": "gzip, deflate",
+    "Prefer": "return=representation"
+}
+
+# === Pooled session ===
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+RESPONSE_CACHE = ResponseCache()
+
+# patient id -> {"types": resource types fetched, "resources": resources indexed by type,
+#                "expires_at": monotonic time, the shortest RESOURCE_TTLS of those types}
+SNAPSHOTS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def create_session(pool_size: int = FHIR_POOL_SIZE,
+                   max_retries: int = FHIR_MAX_RETRIES,
+                   backoff_factor: float = FHIR_BACKOFF_FACTOR) -> requests.Session:
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = FHIR_AUTH
+    session.headers.update(FHIR_HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def fhir_url(path: str) -> str:
+    return path if path.startswith("http") else f"{FHIR_BASE_URL}/{path.lstrip('/')}"
+
+
+def fhir_get(path: str, params: Optional[Dict[str, Any]] = None,
+             headers: Optional[Dict[str, str]] = None) -> requests.Response:
+    return get_session().get(fhir_url(path), params=params, headers=headers,
+                             timeout=(FHIR_CONNECT_TIMEOUT, FHIR_READ_TIMEOUT))
+
+
+def fhir_get_json(path: str, params: Optional[Dict[str, Any]] = None, use_cache: bool = FHIR_CACHE_ENABLED) -> Any:
+    # Cached GET: fresh entries are served locally, stale entries with an ETag
+    # are revalidated with If-None-Match, everything else goes to the server.
+    if not use_cache:
+        response = fhir_get(path, params)
+        response.raise_for_status()
+        return response.json()
+
+    url = fhir_url(path)
+    key = normalize_key(url, params)
+    ttl = RESPONSE_CACHE.ttl_for(resource_type_of(url, FHIR_BASE_URL))
+    cached = RESPONSE_CACHE.lookup(key)
+    headers = None
+    if cached:
+        body, etag, fresh = cached
+        if fresh:
+            return body
+        headers = {"If-None-Match": etag}
+
+    response = fhir_get(url, params, headers)
+    if response.status_code == 304:
+        body = RESPONSE_CACHE.mark_revalidated(key, ttl)
+        if body is not None:
+            return body
+        response = fhir_get(url, params)
+    elif cached:
+        RESPONSE_CACHE.mark_stale_miss()
+    response.raise_for_status()
+    body = response.json()
+    RESPONSE_CACHE.store(key, body, response.headers.get("ETag"), ttl)
+    return body
+
+
+def cache_stats() -> Dict[str, Any]:
+    return RESPONSE_CACHE.stats()
+
+
+# === Bundle paging ===
+def next_link(bundle: Dict[str, Any]) -> Optional[str]:
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next":
+            return link.get("url")
+    return None
+
+
+def iter_bundle_entries(path: str, params: Optional[Dict[str, Any]] = None,
+                        count: Optional[int] = FHIR_PAGE_SIZE,
+                        use_cache: bool = FHIR_CACHE_ENABLED) -> Iterator[Dict[str, Any]]:
+    # Follows link[rel=next] lazily: the next page is only requested once the
+    # caller has consumed every entry of the current one, and only one page is
+    # held in memory at a time. Only the first page goes through the response
+    # cache, so a long history is never kept there page by page.
+    params = dict(params or {})
+    if count:
+        params["_count"] = count
+    url: Optional[str] = path
+    while url:
+        bundle = fhir_get_json(url, params, use_cache)
+        for entry in bundle.get("entry", []):
+            yield entry
+        url = next_link(bundle)
+        params = None  # the next link already carries the full query
+        use_cache = False
+
+
+def iter_resources(path: str, params: Optional[Dict[str, Any]] = None,
+                   count: Optional[int] = FHIR_PAGE_SIZE,
+                   resource_type: Optional[str] = None,
+                   use_cache: bool = FHIR_CACHE_ENABLED) -> Iterator[Dict[str, Any]]:
+    for entry in iter_bundle_entries(path, params, count, use_cache):
+        resource = entry.get("resource", {})
+        # Skip OperationOutcome and included resources unless they were asked for
+        if resource_type and resource.get("resourceType") != resource_type:
+            continue
+        yield resource
+
+
+# === Resource summaries ===
+def summarize_patient(resource: Dict[str, Any]) -> Dict[str, Any]:
+    names = resource.get("name", [])
+    display_name = "Unknown"
+    if names:
+        given = " ".join(names[0].get("given", []))
+        family = names[0].get("family", "")
+        display_name = f"{given} {family}".strip()
+    return {
+        "id": resource.get("id"),
+        "name": display_name,
+        "gender": resource.get("gender", "unknown"),
+        "birthDate": resource.get("birthDate", "unknown")
+    }
+
+
+def summarize_immunization(resource: Dict[str, Any]) -> Dict[str, Any]:
+    code = None
+    code_display = resource.get("vaccineCode", {}).get("text")
+    for c in resource.get("vaccineCode", {}).get("coding", []):
+        if c.get("system") == CVX_SYSTEM:
+            code = c.get("code")
+            if not code_display:
+                code_display = c.get("display")
+    return {
+        "cvx_code": code,
+        "status": resource.get("status", "unknown"),
+        "date": resource.get("occurrenceDateTime", "unknown"),
+        "description": code_display or "Unknown"
+    }
+
+
+def codeable_concept(concept: Dict[str, Any]) -> Tuple[Optional[str], str]:
+    # (first code, display text) of a CodeableConcept
+    codings = concept.get("coding", [])
+    code = codings[0].get("code") if codings else None
+    text = concept.get("text") or next((c.get("display") for c in codings if c.get("display")), None)
+    return code, text or "Unknown"
+
+
+def summarize_condition(resource: Dict[str, Any]) -> Dict[str, Any]:
+    code, description = codeable_concept(resource.get("code", {}))
+    status, _ = codeable_concept(resource.get("clinicalStatus", {}))
+    return {
+        "code": code,
+        "description": description,
+        "clinical_status": status or "unknown",
+        "onset": resource.get("onsetDateTime") or resource.get("recordedDate", "unknown")
+    }
+
+
+def summarize_observation(resource: Dict[str, Any]) -> Dict[str, Any]:
+    code, description = codeable_concept(resource.get("code", {}))
+    value: Any = None
+    if "valueQuantity" in resource:
+        quantity = resource["valueQuantity"]
+        value = f"{quantity.get('value')} {quantity.get('unit') or ''}".strip()
+    elif "valueCodeableConcept" in resource:
+        value = codeable_concept(resource["valueCodeableConcept"])[1]
+    else:
+        value = resource.get("valueString")
+    return {
+        "code": code,
+        "description": description,
+        "value": value,
+        "date": resource.get("effectiveDateTime") or resource.get("issued", "unknown")
+    }
+
+
+# Snapshot output: resource type -> (summary key, summarizer)
+SNAPSHOT_SUMMARIES = {
+    "Immunization": ("immunizations", summarize_immunization),
+    "Condition": ("conditions", summarize_condition),
+    "Observation": ("observations", summarize_observation),
+}
+
+
+def last_name_fragment(name: str) -> str:
+    # Assume last name is the last word and extract first 4 alphanumeric characters
+    name_parts = name.strip().split()
+    if not name_parts:
+        return ""
+    return re.sub(r"[^A-Za-z0-9]", "", name_parts[-1])[:4]
+
+
+# === Streaming searches ===
+def iter_patients_by_name(name: str, count: Optional[int] = FHIR_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    fragment = last_name_fragment(name)
+    if not fragment:
+        print("No usable last name fragment found.")
+        return
+    for resource in iter_resources("Patient", {"family:contains": fragment}, count, "Patient"):
+        yield summarize_patient(resource)
+
+
+def iter_immunizations(patient_id: str, count: Optional[int] = FHIR_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    snapshot = get_snapshot(patient_id)
+    if snapshot and "Immunization" in snapshot["types"]:
+        for resource in snapshot["resources"].get("Immunization", []):
+            yield summarize_immunization(resource)
+        return
+    params = {"patient": f"Patient/{patient_id.strip()}"}
+    for resource in iter_resources("Immunization", params, count, "Immunization"):
+        yield summarize_immunization(resource)
+
+
+# === Patient snapshots ===
+def fetch_patient_bundle(patient_id: str, include: Iterable[str]) -> List[Dict[str, Any]]:
+    # Patient/{id}/$everything limited to the requested types; servers without
+    # $everything get the equivalent _id + _revinclude search instead. Every
+    # $everything page is read before any is used, so a failure on a later
+    # page falls back cleanly instead of mixing the two result sets.
+    types = ["Patient"] + [t for t in include if t != "Patient"]
+    try:
+        return list(iter_resources(f"Patient/{patient_id}/$everything", {"_type": ",".join(types)}))
+    except requests.RequestException as e:  # 5xx after retries arrive as RetryError
+        print("[Debug] $everything unavailable, falling back to _revinclude:", e)
+    params = [("_id", patient_id)] + [
+        ("_revinclude", f"{t}:{'patient' if t == 'Immunization' else 'subject'}") for t in types[1:]
+    ]
+    return list(iter_resources(f"{fhir_url('Patient')}?{urlencode(params)}"))
+
+
+def get_snapshot(patient_id: str) -> Optional[Dict[str, Any]]:
+    # Snapshots expire like the cached responses they stand in for
+    patient_id = patient_id.strip()
+    with _snapshots_lock:
+        snapshot = SNAPSHOTS.get(patient_id)
+        if snapshot is None:
+            return None
+        if snapshot["expires_at"] <= time.monotonic():
+            del SNAPSHOTS[patient_id]
+            return None
+        SNAPSHOTS.move_to_end(patient_id)
+        return snapshot
+
+
+def clear_snapshots():
+    with _snapshots_lock:
+        SNAPSHOTS.clear()
+
+
+# === Tools ===
+# A failed lookup returns an empty result, or with report_errors=True (the
+# ReAct agents, agent4-6) an "Error fetching ..." string, so the model sees
+# the failure instead of trusting "no patients" / "no immunizations".
+def GetPatientByName(name: str, birth_date: Optional[str] = None,
+                     report_errors: bool = False) -> Union[List[Dict[str, Any]], str]:
+    print(f"[Tool] GetPatientByName: {name}")
+    patients = []
+    try:
+        if USE_LOCAL_PATIENT_INDEX:
+            from patientindex import search_patients
+            return search_patients(name, birth_date)
+        for patient in iter_patients_by_name(name):
+            patients.append(patient)
+    except requests.RequestException as e:
+        print("FHIR Patient lookup failed:", e)
+        return f"Error fetching patient: {e}" if report_errors else []
+    return patients
+
+
+def GetAllImmunizations(patient_id: str, report_errors: bool = False) -> Union[List[Dict[str, Any]], str]:
+    print(f"[Tool] GetAllImmunizations: {patient_id}")
+    immunizations = []
+    try:
+        for immunization in iter_immunizations(patient_id):
+            immunizations.append(immunization)
+    except requests.RequestException as e:
+        print("FHIR Immunization lookup failed:", e)
+        return f"Error fetching immunizations: {e}" if report_errors else []
+    return immunizations
+
+
+def GetPatientSnapshot(patient_id: str, include: Iterable[str] = ("Immunization",),
+                       report_errors: bool = False) -> Union[Dict[str, Any], str]:
+    # One bundled request for the patient and the requested resource types.
+    # The resources are kept in memory, indexed by type, and later tool calls
+    # for this patient (GetAllImmunizations) are answered from the snapshot.
+    patient_id = patient_id.strip()
+    include = tuple(include)
+    print(f"[Tool] GetPatientSnapshot: {patient_id} ({', '.join(include)})")
+    by_type: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        for resource in fetch_patient_bundle(patient_id, include):
+            by_type.setdefault(resource.get("resourceType", "Unknown"), []).append(resource)
+    except requests.RequestException as e:
+        print("FHIR snapshot lookup failed:", e)
+        return f"Error fetching patient snapshot: {e}" if report_errors else {}
+
+    with _snapshots_lock:
+        types = set(include) | {"Patient"}
+        ttl = min(RESPONSE_CACHE.ttl_for(t) for t in types)
+        SNAPSHOTS[patient_id] = {"types": types, "resources": by_type, "expires_at": time.monotonic() + ttl}
+        SNAPSHOTS.move_to_end(patient_id)
+        while len(SNAPSHOTS) > FHIR_SNAPSHOT_LIMIT:
+            SNAPSHOTS.popitem(last=False)
+
+    patients = by_type.get("Patient", [])
+    summary: Dict[str, Any] = {
+        "patient": summarize_patient(patients[0]) if patients else None,
+        "counts": {t: len(by_type.get(t, [])) for t in include}
+    }
+    for resource_type in include:
+        if resource_type in SNAPSHOT_SUMMARIES:
+            key, summarize = SNAPSHOT_SUMMARIES[resource_type]
+            summary[key] = [summarize(r) for r in by_type.get(resource_type, [])]
+    return summary
@@ -0,0 +1,238 @@
+# Local main-content extraction for webtext.py, with the standard library
+# html.parser and a readability-style score: paragraphs vote for the element
+# that contains them (long, comma-rich text counts more, link lists count
+# less), and the best-scoring container plus its strong siblings is kept.
+# Scripts, styles, SVG, nav, footers and the like never reach the LLM.
+
+import re
+from html import unescape
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from observations import estimate_tokens
+
+SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "head", "canvas", "math", "select", "button"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+BOILERPLATE_TAGS = {"nav", "footer", "header", "aside", "form", "menu", "dialog"}
+BLOCK_TAGS = {"p", "pre", "blockquote", "li", "h1", "h2", "h3", "h4", "h5", "h6", "td", "th", "dd", "dt", "figcaption"}
+CONTAINER_TAGS = {"div", "section", "article", "main", "body", "td", "blockquote"}
+
+POSITIVE_RE = re.compile(r"article|body|content|entry|main|page|post|story|text|blog", re.I)
+NEGATIVE_RE = re.compile(r"nav|menu|footer|header|sidebar|side-bar|comment|share|social|cookie|consent|banner|"
+                         r"promo|advert|\bads?\b|related|breadcrumb|subscribe|newsletter|popup|modal|widget", re.I)
+WHITESPACE_RE = re.compile(r"\s+")
+
+MIN_PARAGRAPH_CHARS = 25
+MIN_ARTICLE_CHARS = 140
+
+
+class Node:
+    __slots__ = ("tag", "hint", "parent", "content", "score", "link_chars", "chars")
+
+    def __init__(self, tag: str, hint: str = "", parent: Optional["Node"] = None):
+        self.tag = tag
+        self.hint = hint  # class + id, for the positive/negative name checks
+        self.parent = parent
+        self.content: list = []  # text and child nodes, in document order
+        self.score = 0.0
+        self.link_chars = 0
+        self.chars = 0
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+
+class DOMBuilder(HTMLParser):
+    # A forgiving element tree: unclosed tags are closed by the nearest
+    # matching end tag, stray end tags are ignored. A skipped element is
+    # skipped up to its own end tag, whatever it holds in between, so omitted
+    # end tags inside it (<option>, <li>) cannot leave the skip open.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("root")
+        self.stack = [self.root]
+        self.skip_tag: Optional[str] = None
+        self.skip_depth = 0  # nesting of skip_tag itself, e.g. <svg> in <svg>
+        self.link_depth = 0
+        self.title = ""
+        self.in_title = False
+        self.title_done = False  # only the document's first <title>, never an <svg><title>
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and not self.title_done and self.skip_tag in (None, "head"):
+            self.in_title = True
+        if self.skip_tag == "head" and tag == "body":
+            self.skip_tag = None  # </head> is optional
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth += 1
+            return
+        if tag in SKIP_TAGS:
+            self.skip_tag = tag
+            self.skip_depth = 1
+            return
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self.stack[-1].content.append("\n")
+            return
+        attrs = dict(attrs)
+        node = Node(tag, f"{attrs.get('class') or ''} {attrs.get('id') or ''} {attrs.get('role') or ''}", self.stack[-1])
+        self.stack[-1].content.append(node)
+        self.stack.append(node)
+        if tag == "a":
+            self.link_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self.in_title:
+            self.in_title = False
+            self.title_done = True
+        if self.skip_tag:
+            if tag == self.skip_tag:
+                self.skip_depth -= 1
+                if not self.skip_depth:
+                    self.skip_tag = None
+            return
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                for node in self.stack[i:]:
+                    if node.tag == "a":
+                        self.link_depth -= 1
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+        if self.skip_tag:
+            return
+        self.stack[-1].content.append(data)
+        size = len(data.strip())
+        for node in self.stack:
+            node.chars += size
+            if self.link_depth:
+                node.link_chars += size
+
+
+# === Text helpers ===
+def inner_text(node: Node, preformatted: bool = False) -> str:
+    preformatted = preformatted or node.tag == "pre"
+    parts = []
+    for item in node.content:
+        if isinstance(item, str):
+            parts.append(item)
+        else:
+            text = inner_text(item, preformatted)
+            parts.append(f"\n{text}\n" if item.tag in BLOCK_TAGS or item.tag in CONTAINER_TAGS else text)
+    text = "".join(parts)
+    if preformatted:
+        return text.strip("\n")
+    return "\n".join(WHITESPACE_RE.sub(" ", line).strip() for line in text.split("\n") if line.strip())
+
+
+def link_density(node: Node) -> float:
+    return node.link_chars / node.chars if node.chars else 0.0
+
+
+def name_weight(node: Node) -> float:
+    weight = 0.0
+    if node.hint.strip():
+        if NEGATIVE_RE.search(node.hint):
+            weight -= 25
+        if POSITIVE_RE.search(node.hint):
+            weight += 25
+    if node.tag in ("article", "main"):
+        weight += 10
+    return weight
+
+
+def is_boilerplate(node: Node, container: Node) -> bool:
+    # Only the elements between the block and the chosen container count: a
+    # page-wide wrapper such as <body class="has-sidebar"> must not hide it all
+    for n in [node, *node.ancestors()]:
+        if n is container:
+            return False
+        if n.tag in BOILERPLATE_TAGS or (n.hint.strip() and name_weight(n) < 0):
+            return True
+    return False
+
+
+def text_blocks(node: Node) -> List[Node]:
+    # Outermost block-level elements, plus containers that hold text directly
+    blocks = []
+    for item in node.content:
+        if not isinstance(item, Node):
+            continue
+        has_own_text = any(isinstance(c, str) and c.strip() for c in item.content)
+        if item.tag in BLOCK_TAGS or (item.tag in CONTAINER_TAGS and has_own_text and not any(
+                isinstance(c, Node) and (c.tag in BLOCK_TAGS or c.tag in CONTAINER_TAGS) for c in item.content)):
+            blocks.append(item)
+        else:
+            blocks.extend(text_blocks(item))
+    return blocks
+
+
+# === Extraction ===
+def score_candidates(root: Node) -> List[Node]:
+    candidates: Dict[int, Node] = {}
+    for block in text_blocks(root):
+        text = inner_text(block)
+        if len(text) < MIN_PARAGRAPH_CHARS or block.tag.startswith("h"):
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        # The paragraph votes for its container, and half a vote for the next one up
+        parent = block.parent if block.tag in BLOCK_TAGS else block
+        for node, share in ((parent, 1.0), (parent.parent if parent else None, 0.5)):
+            if node is None or node is root:
+                continue
+            if id(node) not in candidates:
+                node.score = name_weight(node)
+                candidates[id(node)] = node
+            node.score += score * share
+    for node in candidates.values():
+        node.score *= 1 - link_density(node)
+    return sorted(candidates.values(), key=lambda n: n.score, reverse=True)
+
+
+def render_blocks(nodes: List[Node]) -> str:
+    paragraphs = []
+    for node in nodes:
+        for block in text_blocks(node) if node.tag not in BLOCK_TAGS else [node]:
+            if is_boilerplate(block, node) or (block.tag == "li" and link_density(block) > 0.5):
+                continue
+            text = inner_text(block)
+            if text and link_density(block) < 0.8:
+                paragraphs.append(text)
+    return "\n\n".join(paragraphs)
+
+
+def extract_main_text(html: str) -> str:
+    builder = DOMBuilder()
+    builder.feed(html)
+    builder.close()
+    root = builder.root
+
+    text = ""
+    candidates = score_candidates(root)
+    if candidates:
+        top = candidates[0]
+        # Articles split over sibling containers: keep siblings scoring close to the top one
+        threshold = max(10.0, top.score * 0.2)
+        siblings = [item for item in (top.parent.content if top.parent else [top])
+                    if isinstance(item, Node) and (item is top or item.score >= threshold)]
+        text = render_blocks(siblings or [top])
+    if len(text) < MIN_ARTICLE_CHARS:
+        # No clear article: everything that is not navigation or chrome
+        text = render_blocks([root])
+    title = WHITESPACE_RE.sub(" ", unescape(builder.title)).strip()
+    if title and text.split("\n", 1)[0] not in title:
+        text = f"{title}\n\n{text}" if text else title
+    return text
+
+
+def extraction_stats(html: str, text: str) -> Dict[str, int]:
+    html_tokens = estimate_tokens(html)
+    text_tokens = estimate_tokens(text)
+    return {"html_tokens": html_tokens, "text_tokens": text_tokens, "tokens_saved": html_tokens - text_tokens}
@@ -0,0 +1,186 @@
+# Deterministic patient-name / disease extraction for the common phrasings
+# ("Has Susan Mann been vaccinated for measles?"), so only the questions the
+# rules are unsure about pay for an LLM round trip.
+
+import os
+import re
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from cvxindex import get_cvx_index
+
+# === Configuration ===
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+LOW_CONFIDENCE = 0.6  # a guess: below the threshold, so the LLM decides
+
+INTENT_STATS = {"rule": 0, "llm_fallback": 0}
+_stats_lock = threading.Lock()
+
+# Lay terms that do not appear in the CVX descriptions -> searchable CVX term
+DISEASE_ALIASES = {
+    "chickenpox": "varicella",
+    "chicken pox": "varicella",
+    "shingles": "zoster",
+    "whooping cough": "pertussis",
+    "german measles": "rubella",
+    "lockjaw": "tetanus",
+    "coronavirus": "covid",
+    "sars-cov-2": "covid",
+    "hpv": "papillomavirus",
+    "pneumonia": "pneumococcal",
+    "flu": "influenza",
+}
+
+DISEASE_PATTERNS = [
+    re.compile(r"\b(?:vaccinated|vaccine|vaccines|vaccination|immuni[sz]ed|protected|covered)\s+(?:for|against)\s+(?:the\s+)?(?P<d>[a-z0-9][\w\- ]*?)(?:\s+(?:yet|already|before|vaccines?|shots?))?\s*(?:[?.!,]|$)", re.I),
+    re.compile(r"\b(?:get|got|gotten|had|has|have|received|receive|taken|take)\s+(?:a|an|the|any|his|her|their)?\s*(?P<d>[a-z0-9][\w\-]*(?:\s+[\w\-]+){0,2}?)\s+(?:vaccines?|vaccinations?|shots?|jabs?|boosters?|immuni[sz]ations?)\b", re.I),
+    re.compile(r"\bup[\s-]to[\s-]date\s+(?:on|with)\s+(?:the\s+|his\s+|her\s+|their\s+)?(?P<d>[a-z0-9][\w\- ]*?)(?:\s+(?:vaccines?|shots?|vaccinations?))?\s*(?:[?.!,]|$)", re.I),
+    re.compile(r"\b(?P<d>[a-z0-9][\w\-]*)\s+(?:vaccines?|vaccinations?|shots?|boosters?)\b", re.I),
+]
+
+NAME = r"(?P<n>[A-Z][a-z'\-]+(?:\s+[A-Z][a-z'\-]+){0,2})"
+NAME_PATTERNS = [
+    re.compile(rf"^\s*(?i:has|have|is|was|did|does|can|should|will)\s+(?i:patient\s+)?{NAME}\b"),
+    re.compile(rf"\b{NAME}'s\b"),
+    re.compile(rf"\b(?i:patient|for|of|about|to)\s+{NAME}\b"),
+]
+
+# Modifiers trimmed off a disease phrase without lowering confidence
+DISEASE_MODIFIERS = {"seasonal", "annual", "yearly", "latest", "recent", "childhood", "routine", "first", "second", "booster"}
+
+# "polio and measles", "flu, covid": more than one disease, never a rule answer
+LIST_RE = re.compile(r",|&|/|\b(?:and|or|plus)\b", re.I)
+
+GENERAL_OPENERS = ("what", "how", "why", "which", "when", "explain", "describe", "tell me about", "list", "define")
+
+QUESTION_WORDS = {
+    "has", "have", "is", "was", "did", "does", "can", "should", "will", "what", "which", "how",
+    "why", "when", "who", "where", "tell", "explain", "describe", "list", "are", "the", "a", "an",
+    "patient", "doctor", "dr", "mr", "mrs", "ms"
+}
+
+
+# === Patient-name gazetteer ===
+_known_names: set = set()
+
+
+def register_patient_names(names: Iterable[str]):
+    # Full names of known patients; a gazetteer hit is trusted over the patterns
+    for name in names:
+        if name and name.strip():
+            _known_names.add(" ".join(name.lower().split()))
+
+
+def find_known_name(question: str) -> Optional[str]:
+    words = re.findall(r"[A-Za-z'\-]+", question)
+    for size in (3, 2, 1):
+        for i in range(len(words) - size + 1):
+            candidate = " ".join(words[i:i + size])
+            if candidate.lower().removesuffix("'s") in _known_names:
+                return candidate.removesuffix("'s")
+    return None
+
+
+# === Extraction ===
+def normalize_disease(phrase: str) -> Tuple[Optional[str], float]:
+    # Returns a term GetVaccineCodes can resolve, trimming leading words
+    # ("the seasonal flu" -> "seasonal flu" -> "flu") until one matches.
+    # Only articles, question words and DISEASE_MODIFIERS are trimmed for
+    # free; dropping anything else ("polio and measles" -> "measles") makes
+    # the term a guess.
+    words = phrase.lower().strip(" -").split()
+    index = get_cvx_index()
+    for start in range(len(words)):
+        candidate = " ".join(words[start:])
+        if candidate in QUESTION_WORDS:
+            continue
+        term = DISEASE_ALIASES.get(candidate, candidate)
+        if len(term) >= 3 and index.search(term):
+            trimmed = any(w not in QUESTION_WORDS and w not in DISEASE_MODIFIERS for w in words[:start])
+            return term, LOW_CONFIDENCE if trimmed or LIST_RE.search(phrase) else 1.0
+    return None, 0.0
+
+
+def extract_disease(question: str) -> Tuple[Optional[str], float]:
+    for pattern in DISEASE_PATTERNS:
+        for match in pattern.finditer(question):
+            disease, confidence = normalize_disease(match.group("d"))
+            if disease:
+                # "for polio, measles?": the match stops at the comma
+                if LIST_RE.match(question[match.end("d"):].lstrip()):
+                    confidence = LOW_CONFIDENCE
+                return disease, confidence
+    return None, 0.0
+
+
+def is_plausible_name(candidate: str) -> bool:
+    words = candidate.lower().split()
+    if not words or words[0] in QUESTION_WORDS:
+        return False
+    # A capitalized disease ("Has Measles ...") is not a patient
+    return normalize_disease(candidate)[0] is None
+
+
+def extract_patient_name(question: str) -> Tuple[Optional[str], float]:
+    known = find_known_name(question)
+    if known:
+        return known, 1.0
+    single = None
+    for pattern in NAME_PATTERNS:
+        for match in pattern.finditer(question):
+            candidate = match.group("n")
+            if not is_plausible_name(candidate):
+                continue
+            if len(candidate.split()) > 1:
+                return candidate, 0.9
+            # One capitalized word ("Is Tylenol safe ...") is as likely a drug
+            # or a place as a patient
+            single = single or candidate
+    if single:
+        return single, LOW_CONFIDENCE
+    # No name found: confident only for plainly general questions, i.e. a
+    # general opener, no capitalized word after it and no possessive
+    text = question.strip()
+    rest = text.split()[1:]
+    if (text.lower().startswith(GENERAL_OPENERS) and "'s" not in text
+            and not any(w[:1].isupper() and not w.isupper() for w in rest)):
+        return None, 0.85
+    return None, 0.5
+
+
+def is_general_question(question: str, threshold: float = INTENT_CONFIDENCE_THRESHOLD) -> bool:
+    # Confidently about no patient at all ("What is the treatment for ...")
+    name, confidence = extract_patient_name(question)
+    return name is None and confidence >= threshold
+
+
+def extract_patient_and_disease(question: str) -> Tuple[Dict[str, Optional[str]], float]:
+    name, name_conf = extract_patient_name(question)
+    disease, disease_conf = extract_disease(question)
+    confidence = min(name_conf if name else 0.0, disease_conf)
+    return {"patient_name": name, "disease": disease}, confidence
+
+
+def count(kind: str):
+    with _stats_lock:
+        INTENT_STATS[kind] += 1
+
+
+def resolve_patient_and_disease(question: str, fallback: Callable[[str], dict],
+                                threshold: float = INTENT_CONFIDENCE_THRESHOLD) -> dict:
+    parsed, confidence = extract_patient_and_disease(question)
+    if confidence >= threshold:
+        count("rule")
+        return parsed
+    count("llm_fallback")
+    return fallback(question)
+
+
+def resolve_patient_name(question: str, fallback: Callable[[str], str],
+                         threshold: float = INTENT_CONFIDENCE_THRESHOLD) -> str:
+    name, confidence = extract_patient_name(question)
+    if confidence >= threshold:
+        count("rule")
+        return name or ""
+    count("llm_fallback")
+    return fallback(question)
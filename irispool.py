@@ -0,0 +1,194 @@
+# Thread-safe IRIS connection pool shared by storecvx, fhiranalytics and the
+# IRIS-backed CVX lookup, so a long-running process logs in once instead of
+# once per question.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import iris
+
+# === Configuration ===
+IRIS_HOST = os.getenv("IRIS_HOST", "127.0.0.1")
+IRIS_PORT = int(os.getenv("IRIS_PORT", "1972"))
+IRIS_NAMESPACE = os.getenv("IRIS_NAMESPACE", "DEMO")
+IRIS_USERNAME = os.getenv("IRIS_USERNAME", "_SYSTEM")
+IRIS_PASSWORD = os.getenv("IRIS_PASSWORD", "ISCDEMO")
+
+IRIS_POOL_MIN = int(os.getenv("IRIS_POOL_MIN", "1"))
+IRIS_POOL_MAX = int(os.getenv("IRIS_POOL_MAX", "5"))
+IRIS_POOL_IDLE_SECONDS = float(os.getenv("IRIS_POOL_IDLE_SECONDS", "300"))
+IRIS_POOL_WAIT_SECONDS = float(os.getenv("IRIS_POOL_WAIT_SECONDS", "30"))
+
+
+def connect():
+    return iris.connect(IRIS_HOST, IRIS_PORT, IRIS_NAMESPACE, IRIS_USERNAME, IRIS_PASSWORD)
+
+
+class PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.monotonic()
+        self.statements: Dict[str, Any] = {}
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def statement(self, sql: str):
+        # One cursor per SQL text, kept for the lifetime of the connection, so
+        # the statement IRIS prepared for it is reused on the next call.
+        cursor = self.statements.get(sql)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            self.statements[sql] = cursor
+        return cursor
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None):
+        cursor = self.statement(sql)
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+        return cursor
+
+    def executemany(self, sql: str, rows: Sequence[Sequence[Any]]):
+        cursor = self.statement(sql)
+        cursor.executemany(sql, rows)
+        return cursor
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def is_healthy(self) -> bool:
+        try:
+            cursor = self.execute("SELECT 1")
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.statements.clear()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class IRISPool:
+    def __init__(self, min_size: int = IRIS_POOL_MIN, max_size: int = IRIS_POOL_MAX,
+                 idle_timeout: float = IRIS_POOL_IDLE_SECONDS, wait_timeout: float = IRIS_POOL_WAIT_SECONDS):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.idle: List[PooledConnection] = []
+        self.size = 0
+        self.cond = threading.Condition()
+        for _ in range(min_size):
+            self.idle.append(PooledConnection(connect()))
+            self.size += 1
+
+    def evict_idle(self):
+        # Close connections idle for longer than idle_timeout, keeping min_size warm
+        now = time.monotonic()
+        keep = []
+        for pooled in self.idle:
+            if now - pooled.last_used > self.idle_timeout and self.size > self.min_size:
+                pooled.close()
+                self.size -= 1
+            else:
+                keep.append(pooled)
+        self.idle = keep
+
+    def checkout(self) -> PooledConnection:
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self.cond:
+                self.evict_idle()
+                pooled = self.idle.pop() if self.idle else None
+                if pooled is None and self.size < self.max_size:
+                    self.size += 1
+                    create = True
+                elif pooled is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No IRIS connection available after {self.wait_timeout}s")
+                    self.cond.wait(remaining)
+                    continue
+                else:
+                    create = False
+
+            if create:
+                try:
+                    return PooledConnection(connect())
+                except Exception:
+                    with self.cond:
+                        self.size -= 1
+                        self.cond.notify()
+                    raise
+
+            # Health check on checkout: drop dead connections and try again
+            if pooled.is_healthy():
+                return pooled
+            pooled.close()
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+
+    def release(self, pooled: PooledConnection, discard: bool = False):
+        with self.cond:
+            if discard:
+                pooled.close()
+                self.size -= 1
+            else:
+                pooled.last_used = time.monotonic()
+                self.idle.append(pooled)
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        pooled = self.checkout()
+        broken = False
+        try:
+            yield pooled
+        except BaseException:
+            # Leave no half-finished transaction behind for the next borrower
+            try:
+                pooled.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(pooled, discard=broken)
+
+    def close_all(self):
+        with self.cond:
+            for pooled in self.idle:
+                pooled.close()
+            self.size -= len(self.idle)
+            self.idle = []
+
+
+# === Process-wide pool ===
+_pool: Optional[IRISPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> IRISPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = IRISPool()
+    return _pool
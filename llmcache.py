@@ -0,0 +1,169 @@
+# Persistent completion cache in front of every LM Studio call.
+# Lookups are exact-match on the full request (model, messages, options)
+# first. Callers asking open-ended general questions (agent1/agent2) can opt
+# in per call to embedding similarity as well, compared only among requests
+# whose earlier messages (system prompt, few-shot block, history) are
+# byte-identical. Never for extraction, ReAct steps or patient-specific
+# answers: there two near-identical prompts ("Susan Mann" / "Susan Marr")
+# need different answers. Prompts
+# are never written to disk: rows hold only keys, embeddings and responses.
+
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# === Configuration ===
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite3"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"  # allows the per-call opt-in
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+# Long final messages (flattened ReAct prompts, web pages) are exact-match only
+LLM_CACHE_SEMANTIC_MAX_CHARS = int(os.getenv("LLM_CACHE_SEMANTIC_MAX_CHARS", "2000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    context_key TEXT NOT NULL,
+    embedding BLOB,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS completions_context ON completions (context_key);
+CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used);
+"""
+
+
+def digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def request_keys(model: str, messages: List[Dict[str, Any]], options: Dict[str, Any]) -> Tuple[str, str]:
+    # (exact key, context key): the context key covers everything but the
+    # content of the final message, which is what semantic matching compares
+    context = {"model": model, "options": options, "messages": messages[:-1],
+               "role": messages[-1].get("role") if messages else None}
+    return digest({"model": model, "options": options, "messages": messages}), digest(context)
+
+
+def cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class CompletionCache:
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 semantic: bool = LLM_CACHE_SEMANTIC, similarity: float = LLM_CACHE_SIMILARITY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(completions)")]
+        if "prompt" in columns:
+            # Caches from before prompts were dropped: discard, plain-text prompts included
+            self.conn.execute("DROP TABLE completions")
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+        self.conn.executescript(SCHEMA)
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity = similarity
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key: str, context_key: str, prompt: str, embed=None,
+               semantic: bool = False) -> Tuple[Optional[str], Optional[List[float]]]:
+        # Returns (response, embedding of prompt); the embedding is handed back
+        # so a miss can be stored without embedding the prompt twice. Only
+        # semantic=True calls embed the prompt or match by similarity.
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM completions WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.touch(key)
+                self.exact_hits += 1
+                return row[0], None
+
+        vector = None
+        if semantic and self.semantic and embed and len(prompt) <= LLM_CACHE_SEMANTIC_MAX_CHARS:
+            vector = embed(prompt)
+        if vector:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT key, embedding, response FROM completions WHERE context_key = ? AND embedding IS NOT NULL",
+                    (context_key,)).fetchall()
+                best = max(((cosine(vector, array("f", blob)), k, response) for k, blob, response in rows), default=None)
+                if best and best[0] >= self.similarity:
+                    self.touch(best[1])
+                    self.semantic_hits += 1
+                    return best[2], vector
+
+        with self.lock:
+            self.misses += 1
+        return None, vector
+
+    def touch(self, key: str):
+        self.conn.execute("UPDATE completions SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+
+    def store(self, key: str, context_key: str, response: str, vector: Optional[List[float]] = None):
+        if not response:
+            return  # failed calls return "", never cache those
+        now = time.time()
+        blob = array("f", vector).tobytes() if vector else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions (key, context_key, embedding, response, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, context_key, blob, response, now, now))
+            # Size bound: drop the least recently used entries
+            count = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self.conn.execute(
+                    "DELETE FROM completions WHERE key IN (SELECT key FROM completions ORDER BY last_used LIMIT ?)",
+                    (excess,))
+                self.evictions += excess
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM completions")
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# === Process-wide cache ===
+_cache: Optional[CompletionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CompletionCache()
+    return _cache
@@ -0,0 +1,336 @@
+# Shared LM Studio client used by every agent's call_mistral helpers.
+# Supports blocking and streaming (server-sent events) chat completions; a
+# streaming call can be cut short as soon as the caller has what it needs.
+
+import json
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+from llmcache import LLM_CACHE_ENABLED, get_completion_cache, request_keys
+
+# === Configuration ===
+LMSTUDIO_API_BASE = os.getenv("LMSTUDIO_API_BASE", "http://localhost:1234/v1")
+MODEL = os.getenv("LMSTUDIO_MODEL", "mistral-7b-instruct-v0.3")
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+DEBUG_PROMPT = os.getenv("AGENT_DEBUG_PROMPT", "0") == "1"
+
+# Per-step generation limits for the ReAct agents: the model must hand control
+# back before it starts inventing its own Observation
+REACT_STOP = ["Observation:", "\nUSER:"]
+REACT_STEP_MAX_TOKENS = int(os.getenv("REACT_STEP_MAX_TOKENS", "256"))
+
+# Constrained decoding: response_format json_schema for extraction calls, and
+# optionally for every ReAct step (see react_step_json)
+LLM_JSON_SCHEMA = os.getenv("LLM_JSON_SCHEMA", "1") == "1"
+REACT_JSON_STEPS = os.getenv("REACT_JSON_STEPS", "0") == "1"
+
+# Embedding model for the semantic side of the completion cache (llmcache.py)
+EMBEDDING_MODEL = os.getenv("LMSTUDIO_EMBEDDING_MODEL", "text-embedding-nomic-embed-text-v1.5")
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+                _session.headers.update({"Content-Type": "application/json"})
+    return _session
+
+
+# === Completions ===
+def iter_sse_tokens(response: requests.Response) -> Iterator[str]:
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        chunk = json.loads(data)
+        choices = chunk.get("choices") or [{}]
+        token = choices[0].get("delta", {}).get("content")
+        if token:
+            yield token
+
+
+def embed(text: str) -> Optional[List[float]]:
+    try:
+        response = get_session().post(f"{LMSTUDIO_API_BASE}/embeddings",
+                                      json={"model": EMBEDDING_MODEL, "input": text}, timeout=LLM_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["data"][0]["embedding"]
+    except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+        print("Embedding request failed:", e)
+        return None
+
+
+def chat_completion(messages: List[Dict[str, str]],
+                    stream: bool = False,
+                    on_token: Optional[Callable[[str], None]] = None,
+                    stop_when: Optional[Callable[[str], Optional[int]]] = None,
+                    use_cache: bool = LLM_CACHE_ENABLED,
+                    semantic: bool = False,
+                    **options) -> str:
+    # Served from the completion cache when the same request was answered
+    # before; a cached answer is handed to on_token in one piece. semantic=True
+    # (general questions only, and only with LLM_CACHE_SEMANTIC=1) also
+    # accepts a close paraphrase asked in the same context.
+    if not use_cache:
+        return request_completion(messages, stream, on_token, stop_when, **options)
+
+    # stop_when changes where the answer is cut, so it is part of the key
+    cache_options = dict(options, stop_when=getattr(stop_when, "__qualname__", None))
+    key, context_key = request_keys(MODEL, messages, cache_options)
+    prompt = messages[-1].get("content", "") if messages else ""
+    cache = get_completion_cache()
+    cached, vector = cache.lookup(key, context_key, prompt, embed, semantic)
+    if cached is not None:
+        if on_token:
+            on_token(cached)
+        return cached
+    text = request_completion(messages, stream, on_token, stop_when, **options)
+    cache.store(key, context_key, text, vector)
+    return text
+
+
+def request_completion(messages: List[Dict[str, str]],
+                       stream: bool = False,
+                       on_token: Optional[Callable[[str], None]] = None,
+                       stop_when: Optional[Callable[[str], Optional[int]]] = None,
+                       **options) -> str:
+    # stop_when receives the text generated so far and returns the index to cut
+    # it at once the answer is complete; the stream is then closed, which makes
+    # LM Studio stop generating.
+    payload = {"model": MODEL, "messages": messages, "stream": stream, **options}
+    try:
+        response = get_session().post(f"{LMSTUDIO_API_BASE}/chat/completions", json=payload,
+                                      stream=stream, timeout=LLM_TIMEOUT)
+        if response.status_code != 200:
+            print("LLM Error Response:", response.text)
+            return ""
+        if not stream:
+            text = response.json()["choices"][0]["message"]["content"]
+            cut = stop_when(text) if stop_when else None
+            return text if cut is None else text[:cut]
+
+        text = ""
+        with response:
+            for token in iter_sse_tokens(response):
+                text += token
+                cut = stop_when(text) if stop_when else None
+                if cut is not None:
+                    token = token[:max(0, len(token) - (len(text) - cut))]
+                    text = text[:cut]
+                if on_token and token:
+                    on_token(token)
+                if cut is not None:
+                    break
+        return text
+    except (requests.RequestException, ValueError) as e:
+        print("Exception calling Mistral:", e)
+        return ""
+
+
+def chat_message(messages: List[Dict[str, Any]], use_cache: bool = LLM_CACHE_ENABLED, **options) -> Dict[str, Any]:
+    # Blocking completion returning the whole assistant message rather than
+    # its text, for callers that need tool_calls; {} on failure.
+    key = context_key = ""
+    if use_cache:
+        key, context_key = request_keys(MODEL, messages, dict(options, response="message"))
+        cached, _ = get_completion_cache().lookup(key, context_key, "")
+        if cached is not None:
+            return json.loads(cached)
+    payload = {"model": MODEL, "messages": messages, "stream": False, **options}
+    try:
+        response = get_session().post(f"{LMSTUDIO_API_BASE}/chat/completions", json=payload, timeout=LLM_TIMEOUT)
+        if response.status_code != 200:
+            print("LLM Error Response:", response.text)
+            return {}
+        message = response.json()["choices"][0]["message"]
+    except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+        print("Exception calling Mistral:", e)
+        return {}
+    if use_cache:
+        get_completion_cache().store(key, context_key, json.dumps(message))
+    return message
+
+
+def token_printer(label: str) -> Callable[[str], None]:
+    started = False
+
+    def on_token(token: str):
+        nonlocal started
+        if not started:
+            print(label, end=" ", flush=True)
+            started = True
+        print(token, end="", flush=True)
+
+    return on_token
+
+
+def chat_completion_echo(messages: List[Dict[str, str]], label: str,
+                         stop_when: Optional[Callable[[str], Optional[int]]] = None,
+                         semantic: bool = False,
+                         **options) -> str:
+    # User-facing completion: streamed token by token when LLM_STREAM is on,
+    # otherwise printed in one piece once it is complete.
+    if LLM_STREAM:
+        text = chat_completion(messages, stream=True, on_token=token_printer(label), stop_when=stop_when,
+                               semantic=semantic, **options)
+        print()
+    else:
+        text = chat_completion(messages, stop_when=stop_when, semantic=semantic, **options)
+        print(label, text)
+    return text
+
+
+# === Flattened ReAct prompts ===
+def render_message(message: Dict[str, str]) -> str:
+    prefix = "Instructions:" if message["role"] == "system" else message["role"].upper() + ":"
+    return f"{prefix} {message['content']}"
+
+
+class FlatPrompt:
+    # The system prompt and few-shot block are rendered once into a stable
+    # prefix and every step only appends its new turns, so the text sent to LM
+    # Studio always starts with the same bytes and its prompt cache is reused.
+    def __init__(self, prefix_messages: List[Dict[str, str]]):
+        self.prefix = "\n\n".join(render_message(m) for m in prefix_messages)
+        self.text = self.prefix
+        self.turns = 0
+
+    def append(self, role: str, content: str):
+        rendered = render_message({"role": role, "content": content})
+        self.text = f"{self.text}\n\n{rendered}" if self.text else rendered
+        self.turns += 1
+
+
+# === ReAct early stop ===
+ACTION_STEP_RE = re.compile(r"Action\s*:\s*\w+.*?Action Input\s*:[^\n]*\S[^\n]*\n", re.S)
+AFTER_FINAL_RE = re.compile(r"Final Answer\s*:.*?\S.*?(\n\s*(?:Thought|Action|Observation)\s*:)", re.S)
+
+
+def react_step_end(text: str) -> Optional[int]:
+    # A step is complete once a full Action / Action Input pair has been
+    # generated, or once the model moves on past its Final Answer.
+    final = AFTER_FINAL_RE.search(text)
+    if final:
+        return final.start(1)
+    action = ACTION_STEP_RE.search(text)
+    if action and "Final Answer" not in text[:action.start()]:
+        return action.end()
+    return None
+
+
+# === Structured (JSON-schema) output ===
+def json_schema_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def json_object_end(text: str) -> Optional[int]:
+    # Index just past the first complete top-level JSON object, so a stream is
+    # closed the moment the object does (whatever the model would add after)
+    depth = 0
+    in_string = escaped = False
+    for i, c in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    # Strict parse first; for unconstrained output, the outermost {...}
+    try:
+        value = json.loads(text)
+        return value if isinstance(value, dict) else {}
+    except ValueError:
+        pass
+    try:
+        start = text.find("{")
+        end = text.rfind("}") + 1
+        value = json.loads(text[start:end])
+        return value if isinstance(value, dict) else {}
+    except ValueError as e:
+        print("Failed to parse JSON:", e)
+        return {}
+
+
+def chat_json(messages: List[Dict[str, str]], name: str, schema: Dict[str, Any], **options) -> Dict[str, Any]:
+    # One constrained call yields a valid object; if the server rejects
+    # response_format (older LM Studio builds), retry once unconstrained.
+    # Streamed, so generation stops as soon as the object is complete.
+    text = ""
+    if LLM_JSON_SCHEMA:
+        text = chat_completion(messages, stream=True, stop_when=json_object_end,
+                               response_format=json_schema_format(name, schema), **options)
+    if not text:
+        text = chat_completion(messages, stream=True, stop_when=json_object_end, **options)
+    return parse_json_object(text)
+
+
+def react_step_schema(tool_names: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "object",
+        "properties": {
+            "thought": {"type": "string"},
+            "action": {"type": "string", "enum": list(tool_names) + ["Final Answer"]},
+            "action_input": {"type": "string"}
+        },
+        "required": ["thought", "action", "action_input"],
+        "additionalProperties": False
+    }
+
+
+def react_step_json(prompt_text: str, tool_names: List[str], **options) -> str:
+    # A ReAct step decoded against react_step_schema and rendered back into
+    # the Thought / Action / Action Input text the agents' prompts and parsers
+    # already use, so the step is always well-formed.
+    step = chat_json([{"role": "user", "content": prompt_text}], "react_step", react_step_schema(tool_names), **options)
+    if not step:
+        return ""
+    thought = step.get("thought", "").strip()
+    if step.get("action") == "Final Answer":
+        return f"Thought: {thought}\nFinal Answer: {step.get('action_input', '').strip()}"
+    return f"Thought: {thought}\nAction: {step.get('action', '')}\nAction Input: {step.get('action_input', '').strip()}\n"
+
+
+def react_step(prompt_text: str, tool_names: List[str], echo: Optional[str] = None,
+               stop: Optional[List[str]] = REACT_STOP, max_tokens: Optional[int] = REACT_STEP_MAX_TOKENS) -> str:
+    # One step of the agent4-6 ReAct loops. Streamed and cut as soon as a full
+    # Action / Action Input pair (or the Final Answer) has been generated, or
+    # with REACT_JSON_STEPS=1 decoded against the step schema instead.
+    if REACT_JSON_STEPS:
+        response = react_step_json(prompt_text, tool_names, **({"max_tokens": max_tokens} if max_tokens else {}))
+        if echo:
+            print(echo, response)
+        return response
+    flat = [{"role": "user", "content": prompt_text}]
+    options: Dict[str, Any] = {}
+    if stop:
+        options["stop"] = stop
+    if max_tokens:
+        options["max_tokens"] = max_tokens
+    if echo:
+        return chat_completion_echo(flat, echo, stop_when=react_step_end, **options)
+    return chat_completion(flat, stop_when=react_step_end, **options)
@@ -1,15 +1,60 @@
-import requests
+import argparse
+import asyncio
+import json
+import random
 import os
+import time
+from typing import Any, Dict, List, Optional
+
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, RateLimitError
+
+from batchio import read_lines, write_results
+from observations import estimate_tokens
+from prompts import register_template, render
 
 
 load_dotenv()
 OPEN_API_KEY = os.getenv("OPENAI_API_KEY")
 
-client = OpenAI()
+POST_MODEL = os.getenv("POST_MODEL", "gpt-4o-mini")
+
+# Batch mode limits (python main.py --batch topics.txt)
+POST_RPM = int(os.getenv("POST_RPM", "500"))          # requests per minute
+POST_TPM = int(os.getenv("POST_TPM", "200000"))       # tokens per minute (prompt + completion)
+POST_CONCURRENCY = int(os.getenv("POST_CONCURRENCY", "16"))
+POST_MAX_TOKENS = int(os.getenv("POST_MAX_TOKENS", "400"))
+POST_MAX_RETRIES = int(os.getenv("POST_MAX_RETRIES", "6"))
+POST_BACKOFF_SECONDS = float(os.getenv("POST_BACKOFF_SECONDS", "1"))
+POST_BACKOFF_MAX_SECONDS = float(os.getenv("POST_BACKOFF_MAX_SECONDS", "60"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+register_template("linkedin.system", "You are an expert social media manager and you excel at creating LinkedIn posts based on user input. Avoid using hashtags, emojis, or jargon. Keep the post professional and concise.")
+register_template("linkedin.user", "Create a LinkedIn post about: $topic")
+
+# Created on first use, so importing this module needs no API key
+_client: Optional[OpenAI] = None
+
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Create LinkedIn posts, interactively or for a list of topics.")
+    parser.add_argument("--batch", metavar="TOPICS", help="file with one topic per line, or - for stdin")
+    parser.add_argument("--output", default="linkedin_posts.jsonl")
+    parser.add_argument("--concurrency", type=int, default=POST_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.batch:
+        stats = asyncio.run(run_batch(read_lines(args.batch), args.output, args.concurrency))
+        print(json.dumps(stats, indent=2))
+        return
+
     print("Hello from lesson26!")
     user_input = input("What should the post be about?")
     openai_post = create_post(user_input)
@@ -18,19 +63,125 @@ def main():
 
 
 
+def post_messages(topic: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": render("linkedin.system")},
+        {"role": "user", "content": render("linkedin.user", topic=topic)}
+    ]
+
+
 def create_post(topic: str) -> str:
-    response = client.chat.completions.create(
-    model="gpt-4o-mini",
-    messages=[
-        {"role": "system", "content": "You are an expert social media manager and you excel at creating LinkedIn posts based on user input. Avoid using hashtags, emojis, or jargon. Keep the post professional and concise."},
-        {"role": "user", "content": f"Create a LinkedIn post about: {topic}"}
-    ],
+    response = get_client().chat.completions.create(
+    model=POST_MODEL,
+    messages=post_messages(topic),
     temperature=0.7
 )
     # return response_text.strip()
-    return response.choices[0].message.content.strip()    
+    return response.choices[0].message.content.strip()
+
+
+# === Batch mode ===
+class TokenBucket:
+    # Two buckets refilled continuously: one in requests, one in tokens. A
+    # request waits until both can cover it; its token cost is estimated up
+    # front (prompt + max completion) and corrected once the usage is known.
+    def __init__(self, requests_per_minute: int = POST_RPM, tokens_per_minute: int = POST_TPM):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int):
+        tokens = min(tokens, self.tpm)  # a single oversized request must still get through
+        async with self.lock:  # FIFO: waiting requests are served in order
+            while True:
+                self.refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max((1 - self.requests) * 60 / self.rpm, (tokens - self.tokens) * 60 / self.tpm)
+                await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int):
+        # Give back what the estimate over-reserved (or take the shortfall)
+        self.tokens = min(self.tpm, self.tokens + estimated - actual)
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    # Retry-After from the server when given, else exponential with full jitter
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            return min(float(retry_after), POST_BACKOFF_MAX_SECONDS)
+    except ValueError:
+        pass
+    return random.uniform(0, min(POST_BACKOFF_MAX_SECONDS, POST_BACKOFF_SECONDS * 2 ** attempt))
+
+
+async def create_post_async(client: AsyncOpenAI, bucket: TokenBucket, topic: str,
+                            stats: Dict[str, Any]) -> Dict[str, Any]:
+    messages = post_messages(topic)
+    estimated = sum(estimate_tokens(m["content"]) for m in messages) + POST_MAX_TOKENS
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"topic": topic}
+    for attempt in range(POST_MAX_RETRIES + 1):
+        await bucket.acquire(estimated)
+        try:
+            response = await client.chat.completions.create(
+                model=POST_MODEL, messages=messages, temperature=0.7, max_tokens=POST_MAX_TOKENS)
+        except (RateLimitError, APIConnectionError, APIStatusError) as e:
+            status = getattr(e, "status_code", None)
+            retryable = isinstance(e, (RateLimitError, APIConnectionError)) or status in RETRY_STATUSES
+            if not retryable or attempt == POST_MAX_RETRIES:
+                result.update(status="error", error=f"{type(e).__name__}: {e}")
+                break
+            stats["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt, e))
+            continue
+        used = response.usage.total_tokens if response.usage else estimated
+        bucket.settle(estimated, used)
+        stats["tokens"] += used
+        result.update(status="ok", post=response.choices[0].message.content.strip(), tokens=used)
+        break
+    result["attempts"] = attempt + 1
+    result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def run_batch(topics: List[str], output_path: str, concurrency: int = POST_CONCURRENCY) -> Dict[str, Any]:
+    # The client retries nothing itself: 429s go through backoff_delay and the bucket
+    client = AsyncOpenAI(max_retries=0)
+    bucket = TokenBucket()
+    limit = asyncio.Semaphore(concurrency)
+    stats: Dict[str, Any] = {"topics": len(topics), "retries": 0, "tokens": 0, "statuses": {}}
+
+    async def worker(topic: str) -> Dict[str, Any]:
+        async with limit:
+            return await create_post_async(client, bucket, topic, stats)
+
+    started = time.perf_counter()
+    try:
+        tasks = [asyncio.create_task(worker(topic)) for topic in topics]
+        stats["statuses"] = await write_results(tasks, output_path)
+    finally:
+        await client.close()
+    elapsed = time.perf_counter() - started
+    stats["elapsed_s"] = round(elapsed, 2)
+    stats["posts_per_min"] = round(len(topics) / elapsed * 60, 1) if elapsed > 0 else 0.0
+    return stats
+
 
-                
 
 
 if __name__ == "__main__":
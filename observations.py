@@ -0,0 +1,154 @@
+# Compaction of tool results before they are appended to a ReAct prompt as an
+# Observation, so prompt size stays bounded however large the FHIR record is.
+
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+# === Configuration ===
+OBSERVATION_TOKEN_BUDGET = int(os.getenv("OBSERVATION_TOKEN_BUDGET", "600"))
+
+# Keyword -> vaccine family, checked against the lower-cased description. A
+# combination vaccine ("Hep A-Hep B", "MMRV") matches, and counts for, every
+# family it covers.
+VACCINE_FAMILIES = [
+    ("covid", "COVID-19"),
+    ("sars-cov-2", "COVID-19"),
+    ("influenza", "Influenza"),
+    ("flu", "Influenza"),
+    ("mmr", "MMR"),
+    ("mmrv", "Varicella"),
+    ("measles", "MMR"),
+    ("zoster", "Zoster"),
+    ("varicella", "Varicella"),
+    ("hep b", "Hepatitis B"),
+    ("hepatitis b", "Hepatitis B"),
+    ("hep a", "Hepatitis A"),
+    ("hepatitis a", "Hepatitis A"),
+    ("hpv", "HPV"),
+    ("papilloma", "HPV"),
+    ("pneumococcal", "Pneumococcal"),
+    ("meningococcal", "Meningococcal"),
+    ("tdap", "Tetanus/Diphtheria/Pertussis"),
+    ("dtap", "Tetanus/Diphtheria/Pertussis"),
+    ("td ", "Tetanus/Diphtheria/Pertussis"),
+    ("tetanus", "Tetanus/Diphtheria/Pertussis"),
+    ("polio", "Polio"),
+    ("ipv", "Polio"),
+    ("hib", "Hib"),
+    ("rotavirus", "Rotavirus"),
+    ("rsv", "RSV"),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough rule of thumb for Mistral-style tokenizers: ~4 characters per token
+    return len(text) // 4 + 1
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def vaccine_families(description: str) -> List[str]:
+    text = f"{(description or '').lower()} "
+    families = []
+    for keyword, family in VACCINE_FAMILIES:
+        if keyword in text and family not in families:
+            families.append(family)
+    return families or [re.split(r"[,(]", description or "Unknown")[0].strip() or "Unknown"]
+
+
+def is_completed(imm: Dict[str, Any]) -> bool:
+    # status is mandatory in FHIR; a record without one is taken at face value
+    return imm.get("status") in (None, "completed")
+
+
+# === Shapes ===
+def to_table(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Column-oriented: keys are written once instead of once per row
+    columns: List[str] = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    return {"columns": columns, "rows": [[row.get(c) for c in columns] for row in rows]}
+
+
+def group_immunizations(immunizations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Only completed records are doses; not-done / entered-in-error records
+    # are listed on their own, with their dates, so they never read as given
+    groups: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for imm in sorted(immunizations, key=lambda i: str(i.get("date") or "")):
+        date = str(imm["date"])[:10] if imm.get("date") else None
+        for family in vaccine_families(imm.get("description", "")):
+            group = groups.setdefault(family, {"family": family, "cvx": [], "doses": 0, "dates": []})
+            if imm.get("cvx_code") and imm["cvx_code"] not in group["cvx"]:
+                group["cvx"].append(imm["cvx_code"])
+            if is_completed(imm):
+                group["doses"] += 1
+                if date:
+                    group["dates"].append(date)
+            else:
+                group.setdefault("not_completed", []).append([imm.get("status"), date])
+    return {"total": len(immunizations), **to_table(list(groups.values()))}
+
+
+def is_immunization_list(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(v, dict) and "cvx_code" in v for v in value)
+
+
+# === Budget fallbacks ===
+def summarize_dates(table: Dict[str, Any]) -> Dict[str, Any]:
+    # Keep only first/last date per row
+    if "dates" not in table.get("columns", []):
+        return table
+    idx = table["columns"].index("dates")
+    rows = []
+    for row in table["rows"]:
+        row = list(row)
+        dates = row[idx] or []
+        row[idx] = dates if len(dates) <= 2 else [dates[0], dates[-1]]
+        rows.append(row)
+    return {**table, "rows": rows, "dates": "first/last only"}
+
+
+def truncate_rows(table: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    rows = list(table["rows"])
+    while rows and estimate_tokens(compact_json({**table, "rows": rows})) > budget:
+        rows.pop()
+    omitted = len(table["rows"]) - len(rows)
+    return {**table, "rows": rows, "omitted_rows": omitted} if omitted else table
+
+
+def truncate_text(text: str, budget: int) -> str:
+    limit = budget * 4
+    return text if len(text) <= limit else text[:limit] + " ...[truncated]"
+
+
+def compact_observation(result: Any, budget: int = OBSERVATION_TOKEN_BUDGET) -> str:
+    if isinstance(result, str):
+        return truncate_text(result, budget)
+
+    if is_immunization_list(result):
+        shaped = group_immunizations(result)
+    elif isinstance(result, list) and result and all(isinstance(r, dict) for r in result):
+        shaped = to_table(result)
+        if len(compact_json(shaped)) >= len(compact_json(result)):
+            shaped = result
+    else:
+        shaped = result
+
+    text = compact_json(shaped)
+    if estimate_tokens(text) <= budget:
+        return text
+    if not (isinstance(shaped, dict) and "rows" in shaped):
+        return truncate_text(text, budget)
+
+    shaped = summarize_dates(shaped)
+    text = compact_json(shaped)
+    if estimate_tokens(text) <= budget:
+        return text
+    return compact_json(truncate_rows(shaped, budget))
@@ -0,0 +1,227 @@
+# Local patient-name index.
+# Instead of a family:contains substring scan on the server for every
+# question, the Patient list is exported once (paged), kept in a trigram +
+# Soundex index and refreshed incrementally with _lastUpdated. Lookups are
+# then a local ranking on given + family name (and DOB when known).
+#
+# Deletions are only noticed on a full rebuild (reload_patient_index).
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import requests
+
+from fhirclient import FHIR_PAGE_SIZE, iter_resources, summarize_patient
+
+# === Configuration ===
+PATIENT_INDEX_PATH = os.getenv("PATIENT_INDEX_PATH", "")  # optional JSON snapshot, reused across runs
+PATIENT_INDEX_REFRESH_SECONDS = float(os.getenv("PATIENT_INDEX_REFRESH_SECONDS", "300"))
+PATIENT_INDEX_MIN_SCORE = float(os.getenv("PATIENT_INDEX_MIN_SCORE", "0.45"))
+PATIENT_INDEX_LIMIT = int(os.getenv("PATIENT_INDEX_LIMIT", "10"))
+
+WORD_RE = re.compile(r"[a-z]+")
+SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(("bfpv", "cgjkqsxz", "dt", "l", "mn", "r"), 1) for c in letters}
+
+
+# === Name keys ===
+def normalize_name(text: str) -> str:
+    return " ".join(WORD_RE.findall((text or "").lower()))
+
+
+def trigrams(text: str) -> Set[str]:
+    # Word-padded trigrams, so "mann" and "manning" share their prefix grams
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def soundex(word: str) -> str:
+    word = normalize_name(word).replace(" ", "")
+    if not word:
+        return ""
+    code = word[0].upper()
+    last = SOUNDEX_CODES.get(word[0], "")
+    for c in word[1:]:
+        digit = SOUNDEX_CODES.get(c, "")
+        if digit and digit != last:
+            code += digit
+        if c not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+
+class PatientNameIndex:
+    def __init__(self):
+        self.patients: Dict[str, Dict[str, Any]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        self.phonetic: Dict[str, Set[str]] = {}
+        self.last_updated = ""  # highest meta.lastUpdated seen
+        self.refreshed_at = 0.0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.patients)
+
+    # === Maintenance ===
+    def add(self, patient: Dict[str, Any], last_updated: str = ""):
+        pid = patient["id"]
+        with self.lock:
+            self.remove(pid)
+            self.patients[pid] = patient
+            for gram in trigrams(patient["name"]):
+                self.grams.setdefault(gram, set()).add(pid)
+            family = patient["name"].split()[-1] if patient["name"].split() else ""
+            if family:
+                self.phonetic.setdefault(soundex(family), set()).add(pid)
+            if last_updated > self.last_updated:
+                self.last_updated = last_updated
+
+    def remove(self, pid: str):
+        with self.lock:
+            old = self.patients.pop(pid, None)
+            if old is None:
+                return
+            for gram in trigrams(old["name"]):
+                self.grams.get(gram, set()).discard(pid)
+            for ids in self.phonetic.values():
+                ids.discard(pid)
+
+    def add_resources(self, resources: Iterable[Dict[str, Any]]) -> int:
+        added = 0
+        for resource in resources:
+            if resource.get("active") is False:
+                self.remove(resource.get("id", ""))
+                continue
+            self.add(summarize_patient(resource), resource.get("meta", {}).get("lastUpdated", ""))
+            added += 1
+        return added
+
+    def build(self, count: int = FHIR_PAGE_SIZE) -> int:
+        # Full paged export; bypasses the response cache, which is sized for
+        # the agents' small lookups and would only be flushed by the export.
+        added = self.add_resources(iter_resources("Patient", {}, count, "Patient", use_cache=False))
+        self.refreshed_at = time.time()
+        return added
+
+    def refresh(self, count: int = FHIR_PAGE_SIZE) -> int:
+        # Only patients changed since the last export/refresh. "ge" rather than
+        # "gt": a second change within the same timestamp is not lost, and
+        # re-adding an unchanged patient is harmless.
+        if not self.last_updated:
+            return self.build(count)
+        params = {"_lastUpdated": f"ge{self.last_updated}"}
+        added = self.add_resources(iter_resources("Patient", params, count, "Patient", use_cache=False))
+        self.refreshed_at = time.time()
+        return added
+
+    def names(self) -> List[str]:
+        with self.lock:
+            return [p["name"] for p in self.patients.values()]
+
+    # === Search ===
+    def candidates(self, query: str) -> Set[str]:
+        ids: Set[str] = set()
+        with self.lock:
+            for gram in trigrams(query):
+                ids |= self.grams.get(gram, set())
+            for word in normalize_name(query).split():
+                ids |= self.phonetic.get(soundex(word), set())
+        return ids
+
+    def score(self, query: str, patient: Dict[str, Any], birth_date: Optional[str] = None) -> float:
+        words = normalize_name(query).split()
+        name = normalize_name(patient["name"]).split()
+        if not words or not name:
+            return 0.0
+        full = similarity(trigrams(query), trigrams(patient["name"]))
+        # The family name carries most of the signal ("Mann" alone, or a
+        # misspelt given name); the full-name score separates the rest.
+        family = similarity(trigrams(words[-1]), trigrams(name[-1]))
+        # Capped before the bonuses, so an exact name still outranks a close
+        # one that also sounds alike (a ranking score: it may exceed 1.0)
+        score = min(max(full, 0.5 * full + 0.5 * family), 1.0)
+        if soundex(words[-1]) == soundex(name[-1]):
+            score += 0.05
+        if birth_date and patient.get("birthDate"):
+            score += 0.2 if patient["birthDate"] == birth_date else -0.3
+        return round(score, 3)
+
+    def search(self, query: str, birth_date: Optional[str] = None,
+               limit: int = PATIENT_INDEX_LIMIT, min_score: float = PATIENT_INDEX_MIN_SCORE) -> List[Dict[str, Any]]:
+        with self.lock:
+            scored = [(self.score(query, self.patients[pid], birth_date), self.patients[pid])
+                      for pid in self.candidates(query)]
+        ranked = sorted((s for s in scored if s[0] >= min_score), key=lambda s: (-s[0], s[1]["name"]))
+        return [dict(patient, score=score) for score, patient in ranked[:limit]]
+
+    # === Persistence ===
+    def save(self, path: str):
+        with self.lock:
+            data = {"last_updated": self.last_updated, "patients": list(self.patients.values())}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> int:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for patient in data.get("patients", []):
+            self.add(patient)
+        self.last_updated = data.get("last_updated", "")
+        return len(self.patients)
+
+
+# === Process-wide index ===
+_index: Optional[PatientNameIndex] = None
+_index_lock = threading.Lock()
+
+
+def reload_patient_index() -> PatientNameIndex:
+    # Full rebuild, swapped in with one assignment like the CVX index
+    global _index
+    index = PatientNameIndex()
+    started = time.perf_counter()
+    index.build()
+    print(f"[PatientIndex] Indexed {len(index)} patients in {time.perf_counter() - started:.2f}s")
+    if PATIENT_INDEX_PATH:
+        index.save(PATIENT_INDEX_PATH)
+    _index = index
+    return index
+
+
+def get_patient_index() -> PatientNameIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            if PATIENT_INDEX_PATH and os.path.exists(PATIENT_INDEX_PATH):
+                index = PatientNameIndex()
+                index.load(PATIENT_INDEX_PATH)
+                _index = index
+            else:
+                return reload_patient_index()
+        if time.time() - _index.refreshed_at > PATIENT_INDEX_REFRESH_SECONDS:
+            try:
+                changed = _index.refresh()
+                if changed and PATIENT_INDEX_PATH:
+                    _index.save(PATIENT_INDEX_PATH)
+            except requests.RequestException as e:
+                # A stale index still answers; the next lookup retries the refresh
+                print("[PatientIndex] Incremental refresh failed:", e)
+    return _index
+
+
+def search_patients(name: str, birth_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_patient_index().search(name, birth_date)
@@ -0,0 +1,82 @@
+# Prompt-template registry shared by webtext.py, main.py and the ReAct agents.
+# Templates are string.Template objects built once at registration; example
+# files (post-examples.json, optional few-shot overrides) are parsed once and
+# re-read only when their mtime changes, and anything derived from them (the
+# rendered few-shot block) is cached alongside.
+
+import json
+import os
+import threading
+from string import Template
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# === Configuration ===
+PROMPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Directory with <agent>.json few-shot overrides for agent4-6 (optional)
+AGENT_EXAMPLES_DIR = os.getenv("AGENT_EXAMPLES_DIR", os.path.join(PROMPTS_DIR, "examples"))
+
+_templates: Dict[str, Template] = {}
+_files: Dict[str, Tuple[float, Any]] = {}  # path -> (mtime, parsed JSON)
+_derived: Dict[Tuple[str, str], Tuple[float, Any]] = {}  # (path, name) -> (mtime, value)
+_lock = threading.Lock()
+
+
+# === Templates ===
+def register_template(name: str, text: str) -> Template:
+    template = Template(text)
+    _templates[name] = template
+    return template
+
+
+def render(name: str, **values: Any) -> str:
+    return _templates[name].substitute(values)
+
+
+# === Example files ===
+def resolve(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(PROMPTS_DIR, path)
+
+
+def load_json(path: str) -> Any:
+    # Parsed once; a changed mtime (the file was edited) triggers a re-read
+    path = resolve(path)
+    mtime = os.stat(path).st_mtime
+    with _lock:
+        cached = _files.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    with _lock:
+        _files[path] = (mtime, data)
+    return data
+
+
+def derived(path: str, name: str, build: Callable[[Any], Any]) -> Any:
+    # build(data) runs once per version of the file, e.g. to render the
+    # few-shot examples block a template embeds
+    path = resolve(path)
+    data = load_json(path)
+    mtime = _files[path][0]
+    with _lock:
+        cached = _derived.get((path, name))
+        if cached and cached[0] == mtime:
+            return cached[1]
+    value = build(data)
+    with _lock:
+        _derived[(path, name)] = (mtime, value)
+    return value
+
+
+def few_shot_examples(agent: str, default: List[Dict[str, str]],
+                      directory: Optional[str] = None) -> List[Dict[str, str]]:
+    # An agent's few-shot block: <agent>.json in AGENT_EXAMPLES_DIR when it
+    # exists (picked up without a restart), otherwise the built-in default
+    path = os.path.join(directory or AGENT_EXAMPLES_DIR, f"{agent}.json")
+    if not os.path.exists(path):
+        return default
+    try:
+        return load_json(path)
+    except (OSError, ValueError) as e:
+        print(f"[Prompts] Ignoring {path}: {e}")
+        return default
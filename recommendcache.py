@@ -0,0 +1,90 @@
+# Disk-backed cache for vaccineagent's Step 7 recommendations.
+# The recommendation only depends on the immunization record, the model and
+# the prompt, so it is keyed on a hash of exactly those; asking again about a
+# patient whose record has not changed skips the LLM call entirely.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# === Configuration ===
+RECOMMENDATION_CACHE_ENABLED = os.getenv("RECOMMENDATION_CACHE_ENABLED", "1") == "1"
+RECOMMENDATION_CACHE_PATH = os.getenv("RECOMMENDATION_CACHE_PATH", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "recommendations.json"))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "1000"))
+RECOMMENDATION_TTL_SECONDS = float(os.getenv("RECOMMENDATION_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def normalize_immunizations(immunizations: List[Dict[str, Any]]) -> List[List[str]]:
+    # Order-independent form of the record: the same shots returned in a
+    # different page order hash the same. The description is part of it, as
+    # it is part of the prompt and the only identity of a record without CVX.
+    return sorted([imm.get("cvx_code") or "", imm.get("status") or "", imm.get("date") or "",
+                   imm.get("description") or ""] for imm in immunizations)
+
+
+def recommendation_key(immunizations: List[Dict[str, Any]], model: str, prompt_version: str) -> str:
+    payload = json.dumps({"immunizations": normalize_immunizations(immunizations),
+                          "model": model, "prompt_version": prompt_version}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    def __init__(self, path: str = RECOMMENDATION_CACHE_PATH, max_entries: int = RECOMMENDATION_CACHE_SIZE,
+                 ttl: float = RECOMMENDATION_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = OrderedDict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print("[RecommendationCache] Ignoring unreadable cache file:", e)
+
+    def save(self):
+        # Written to a temp file and renamed, so a crash never leaves half a file
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp, self.path)
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["stored"] > self.ttl:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["text"]
+
+    def put(self, key: str, text: str):
+        if not text:
+            return  # failed calls return "", never cache those
+        with self.lock:
+            self.entries[key] = {"text": text, "stored": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            try:
+                self.save()
+            except OSError as e:
+                print("[RecommendationCache] Could not write cache file:", e)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
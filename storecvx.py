@@ -1,97 +1,113 @@
-import iris
+import time
+
 import pandas as pd
 
+from irispool import get_pool
+
 def cvstable():
-    conn = None
-    cursor = None
     try:
-        # Connect to IRIS instance
-        conn = iris.connect("127.0.0.1", 1972, "DEMO", "_SYSTEM", "ISCDEMO")
-        cursor = conn.cursor()
-
-        # Define SQL for table creation
-        create_table_cvx = """
-        CREATE TABLE IF NOT EXISTS sql1.cvx_codes (
-            cvx_code INT PRIMARY KEY,
-            short_description VARCHAR(255),
-            full_vaccine_name VARCHAR(512),
-            note TEXT,
-            vaccine_status VARCHAR(32),
-            internal_id INT,
-            nonvaccine VARCHAR(5),
-            update_date DATE
-        )
-        """
-
-        # Execute SQL
-        cursor.execute(create_table_cvx)
-        print("Table 'cvx_codes' created or already exists.")
+        # Borrow a connection from the shared IRIS pool
+        with get_pool().connection() as conn:
+            # Define SQL for table creation
+            create_table_cvx = """
+            CREATE TABLE IF NOT EXISTS sql1.cvx_codes (
+                cvx_code INT PRIMARY KEY,
+                short_description VARCHAR(255),
+                full_vaccine_name VARCHAR(512),
+                note TEXT,
+                vaccine_status VARCHAR(32),
+                internal_id INT,
+                nonvaccine VARCHAR(5),
+                update_date DATE
+            )
+            """
+
+            # Execute SQL
+            conn.execute(create_table_cvx)
+            print("Table 'cvx_codes' created or already exists.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
-
-def insert_cvx_codes(csv_path):
+CVX_COLUMNS = [
+    "cvx_code", "short_description", "full_vaccine_name", "note",
+    "vaccine_status", "internal_id", "nonvaccine", "update_date"
+]
+
+
+def read_cvx_csv(csv_path):
+    # Read and clean CSV
+    df = pd.read_csv(csv_path)
+    df = df.drop(columns=[col for col in df.columns if col.startswith("Unnamed")])
+
+    df.rename(columns={
+        "CVX Code": "cvx_code",
+        "CVX Short Description": "short_description",
+        "Full Vaccine Name": "full_vaccine_name",
+        "Note": "note",
+        "VaccineStatus": "vaccine_status",
+        "internalID": "internal_id",
+        "nonvaccine": "nonvaccine",
+        "update_date": "update_date"
+    }, inplace=True)
+
+    df["cvx_code"] = df["cvx_code"].astype(str).str.strip().astype(int)
+    df["nonvaccine"] = df["nonvaccine"].astype(str)  # Convert to VARCHAR-compatible
+    df["update_date"] = pd.to_datetime(df["update_date"], errors="coerce").dt.date
+    df = df.drop_duplicates(subset="cvx_code", keep="last")
+
+    # Plain Python values (None instead of NaN/NaT) for the DB-API driver
+    df = df[CVX_COLUMNS].astype(object).where(df[CVX_COLUMNS].notna(), None)
+    return df
+
+
+def changed_rows(conn, df):
+    # Delta mode: only rows that are new or whose update_date differs from the table
+    cursor = conn.execute("SELECT cvx_code, update_date FROM sql1.cvx_codes")
+    existing = {int(code): str(update_date) if update_date is not None else None
+                for code, update_date in cursor.fetchall()}
+    keep = [
+        int(row.cvx_code) not in existing
+        or existing[int(row.cvx_code)] != (str(row.update_date) if row.update_date is not None else None)
+        for row in df.itertuples(index=False)
+    ]
+    return df[keep]
+
+
+def insert_cvx_codes(csv_path, batch_size=500, delta=False):
     try:
-        # Read and clean CSV
-        df = pd.read_csv(csv_path)
-        df = df.drop(columns=[col for col in df.columns if col.startswith("Unnamed")])
-
-        df.rename(columns={
-            "CVX Code": "cvx_code",
-            "CVX Short Description": "short_description",
-            "Full Vaccine Name": "full_vaccine_name",
-            "Note": "note",
-            "VaccineStatus": "vaccine_status",
-            "internalID": "internal_id",
-            "nonvaccine": "nonvaccine",
-            "update_date": "update_date"
-        }, inplace=True)
-
-        df["nonvaccine"] = df["nonvaccine"].astype(str)  # Convert to VARCHAR-compatible
-        df["update_date"] = pd.to_datetime(df["update_date"], errors="coerce").dt.date
-
-        # Connect to IRIS
-        conn = iris.connect("127.0.0.1", 1972, "DEMO", "_SYSTEM", "ISCDEMO")
-        cursor = conn.cursor()
-
-        insert_sql = """
-        INSERT INTO sql1.cvx_codes (
-            cvx_code, short_description, full_vaccine_name, note,
-            vaccine_status, internal_id, nonvaccine, update_date
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-
-        for row in df.itertuples(index=False):
-            cursor.execute(insert_sql, (
-                row.cvx_code,
-                row.short_description,
-                row.full_vaccine_name,
-                row.note if pd.notna(row.note) else None,
-                row.vaccine_status,
-                row.internal_id,
-                row.nonvaccine,
-                row.update_date
-            ))
-
-        conn.commit()
-        print("CVX codes successfully inserted into IRIS.")
+        started = time.perf_counter()
+        df = read_cvx_csv(csv_path)
+
+        # Borrow a connection from the shared IRIS pool; it is rolled back if anything below fails
+        with get_pool().connection() as conn:
+            if delta:
+                total = len(df)
+                df = changed_rows(conn, df)
+                print(f"Delta mode: {len(df)} of {total} CVX codes are new or changed.")
+
+            # INSERT OR UPDATE makes re-runs idempotent: rows are upserted on the cvx_code primary key
+            upsert_sql = """
+            INSERT OR UPDATE INTO sql1.cvx_codes (
+                cvx_code, short_description, full_vaccine_name, note,
+                vaccine_status, internal_id, nonvaccine, update_date
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+
+            rows = list(df.itertuples(index=False, name=None))
+            for start in range(0, len(rows), batch_size):
+                conn.executemany(upsert_sql, rows[start:start + batch_size])
+
+            # One transaction for the whole load
+            conn.commit()
+
+        elapsed = time.perf_counter() - started
+        rate = len(rows) / elapsed if elapsed > 0 else 0.0
+        print(f"CVX codes successfully upserted into IRIS: {len(rows)} rows in {elapsed:.2f}s ({rate:.0f} rows/sec).")
 
     except Exception as e:
         print(f"Error inserting CVX codes: {e}")
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 
 
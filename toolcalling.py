@@ -0,0 +1,132 @@
+# Structured tool-calling mode for the ReAct agents (agent4-6).
+# Instead of describing the tools in prose and recovering Action / Action
+# Input with regexes, the TOOLS registry is sent to LM Studio as OpenAI-style
+# function schemas and the model answers with tool_calls. Several calls in
+# one step run concurrently, so "find two patients" costs one round trip.
+#
+#   AGENT_TOOL_MODE=1 python agent6.py
+
+import inspect
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from lmstudio import chat_message, DEBUG_PROMPT
+from observations import compact_observation
+
+# === Configuration ===
+AGENT_TOOL_MODE = os.getenv("AGENT_TOOL_MODE", "0") == "1"
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "6"))
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+
+# Descriptions shown to the model: tool -> (what it does, {parameter: meaning})
+TOOL_DESCRIPTIONS = {
+    "GetPatientByName": (
+        "Find patients in the FHIR server by name. Returns id, name, gender and birthDate of each match.",
+        {"name": "The patient's full name, e.g. 'Susan Mann'",
+         "birth_date": "Birth date as YYYY-MM-DD, only if the user gave one"}
+    ),
+    "GetAllImmunizations": (
+        "Get all immunizations of one patient. Returns cvx_code, status, date and description of each.",
+        {"patient_id": "The FHIR Patient id returned by GetPatientByName"}
+    ),
+    "GetPatientSnapshot": (
+        "Get a patient's record (demographics plus the requested resource types) in one call.",
+        {"patient_id": "The FHIR Patient id returned by GetPatientByName"}
+    ),
+}
+
+TOOL_AGENT_PROMPT = (
+    "You are an autonomous clinical assistant agent. Use the provided tools to look up patients and their"
+    " immunizations in the FHIR server; never guess data a tool can return. When several lookups are"
+    " independent, request them together in one step. When you have enough information, answer the user"
+    " directly and concisely. Do not schedule appointments or send messages; your job is only to assess"
+    " immunization status."
+)
+
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+# === Schemas ===
+def tool_schema(name: str, fn: Callable) -> Dict[str, Any]:
+    description, param_docs = TOOL_DESCRIPTIONS.get(name, ((fn.__doc__ or name).strip(), {}))
+    properties = {}
+    required = []
+    for param in inspect.signature(fn).parameters.values():
+        if param.name not in param_docs and param.default is not inspect.Parameter.empty:
+            continue  # optional arguments the model is not told about keep their defaults
+        schema = {"type": JSON_TYPES.get(param.annotation, "string")}
+        if param.name in param_docs:
+            schema["description"] = param_docs[param.name]
+        properties[param.name] = schema
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required}
+        }
+    }
+
+
+def tool_schemas(tools: Dict[str, Callable]) -> List[Dict[str, Any]]:
+    return [tool_schema(name, fn) for name, fn in tools.items()]
+
+
+# === Execution ===
+def run_tool_call(call: Dict[str, Any], tools: Dict[str, Callable]) -> Dict[str, Any]:
+    function = call.get("function", {})
+    name = function.get("name", "")
+    try:
+        if name not in tools:
+            raise ValueError(f"Unknown or disallowed tool: {name}")
+        arguments = json.loads(function.get("arguments") or "{}")
+        if not isinstance(arguments, dict):
+            raise ValueError("Tool arguments must be a JSON object")
+        content = compact_observation(tools[name](**arguments))
+    except (ValueError, TypeError) as e:
+        # Reported back to the model, which can correct the call next step
+        print(f"[Error] {name}: {e}")
+        content = f"Error: {e}"
+    return {"role": "tool", "tool_call_id": call.get("id", ""), "name": name, "content": content}
+
+
+def run_tool_calls(calls: List[Dict[str, Any]], tools: Dict[str, Callable],
+                   workers: int = TOOL_WORKERS) -> List[Dict[str, Any]]:
+    if len(calls) == 1:
+        return [run_tool_call(calls[0], tools)]
+    # Results come back in call order, whatever order they finish in
+    with ThreadPoolExecutor(max_workers=min(workers, len(calls))) as pool:
+        return list(pool.map(lambda call: run_tool_call(call, tools), calls))
+
+
+# === Agent loop ===
+def run_tool_agent(user_question: str, tools: Dict[str, Callable], system_prompt: str = TOOL_AGENT_PROMPT,
+                   max_steps: int = AGENT_MAX_STEPS, debug: bool = DEBUG_PROMPT) -> str:
+    schemas = tool_schemas(tools)
+    messages: List[Dict[str, Any]] = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_question.strip()}
+    ]
+    for step in range(max_steps):
+        if debug:
+            print("\n======== Messages to Mistral ========")
+            print(json.dumps(messages, indent=2))
+
+        message = chat_message(messages, tools=schemas, tool_choice="auto")
+        calls = message.get("tool_calls") or []
+        if not calls:
+            answer = message.get("content") or ""
+            print("\n[Final Answer]", answer)
+            return answer
+
+        print(f"\n[Agent] Step {step + 1}: " + ", ".join(
+            f"{c.get('function', {}).get('name')}({c.get('function', {}).get('arguments')})" for c in calls))
+        messages.append({"role": "assistant", "content": message.get("content") or "", "tool_calls": calls})
+        messages.extend(run_tool_calls(calls, tools))
+
+    print(f"\n[Error] No answer after {max_steps} steps")
+    return ""
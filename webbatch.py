@@ -0,0 +1,214 @@
+# Batch mode for webtext.py: fetch -> extract -> summarize -> X post for a
+# whole list of URLs. Pages are fetched concurrently over one pooled async
+# client, each LLM stage runs with its own concurrency limit (so a slow
+# stage never holds up the fetches), and every stage's output is
+# checkpointed to disk, so rerunning the same list only redoes what failed.
+#
+#   python webbatch.py urls.txt --output posts.jsonl
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAIError
+
+from batchio import percentile, read_lines, write_results
+from webtext import (
+    EXTRACT_MODEL, SUMMARY_MODEL, POST_MODEL, WEB_LLM_REFINE, SUMMARY_PARALLELISM,
+    pre_extract, split_into_chunks, extract_prompt, refine_prompt, summarize_prompt, merge_prompt, x_post_prompt
+)
+
+# === Configuration ===
+WEB_FETCH_CONCURRENCY = int(os.getenv("WEB_FETCH_CONCURRENCY", "20"))
+WEB_LLM_CONCURRENCY = int(os.getenv("WEB_LLM_CONCURRENCY", "4"))  # per LLM stage
+WEB_FETCH_TIMEOUT = float(os.getenv("WEB_FETCH_TIMEOUT", "30"))
+WEB_CHECKPOINT_DIR = os.getenv("WEB_CHECKPOINT_DIR", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "webtext"))
+
+STAGES = ("fetch", "extract", "summarize", "post")
+
+
+def read_urls(path: str) -> List[str]:
+    # Duplicates would only race on the same checkpoints
+    return list(dict.fromkeys(read_lines(path)))
+
+
+# === Checkpoints ===
+class Checkpoints:
+    def __init__(self, directory: str = WEB_CHECKPOINT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url: str, stage: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.directory, f"{key}.{stage}.txt")
+
+    def load(self, url: str, stage: str) -> Optional[str]:
+        try:
+            with open(self.path(url, stage), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, url: str, stage: str, text: str):
+        path = self.path(url, stage)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+# === Stage metrics ===
+class StageStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.resumed: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self.failed: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self.tokens_saved: List[int] = []
+
+    def report(self) -> Dict[str, Any]:
+        report = {}
+        for stage in STAGES:
+            values = self.latencies[stage]
+            report[stage] = {
+                "runs": len(values),
+                "resumed": self.resumed[stage],
+                "failed": self.failed[stage],
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+                "max_ms": round(max(values, default=0.0), 1)
+            }
+        report["extract"]["tokens_saved"] = sum(self.tokens_saved)
+        report["extract"]["tokens_saved_per_page"] = round(statistics.mean(self.tokens_saved)) if self.tokens_saved else 0
+        return report
+
+
+class Pipeline:
+    def __init__(self, checkpoints: Checkpoints, fetch_concurrency: int = WEB_FETCH_CONCURRENCY,
+                 llm_concurrency: int = WEB_LLM_CONCURRENCY):
+        self.checkpoints = checkpoints
+        self.stats = StageStats()
+        # One limit per stage: waiting on a semaphore is the stage's queue
+        self.limits = {stage: asyncio.Semaphore(fetch_concurrency if stage == "fetch" else llm_concurrency)
+                       for stage in STAGES}
+        self.http = httpx.AsyncClient(
+            timeout=WEB_FETCH_TIMEOUT, follow_redirects=True,
+            limits=httpx.Limits(max_connections=fetch_concurrency, max_keepalive_connections=fetch_concurrency)
+        )
+        self.llm = AsyncOpenAI()
+
+    async def aclose(self):
+        await self.http.aclose()
+        await self.llm.close()
+
+    async def run_stage(self, url: str, stage: str, work: Callable[[], Awaitable[str]]) -> str:
+        cached = self.checkpoints.load(url, stage)
+        if cached is not None:
+            self.stats.resumed[stage] += 1
+            return cached
+        async with self.limits[stage]:
+            started = time.perf_counter()
+            try:
+                text = await work()
+            except Exception:
+                self.stats.failed[stage] += 1
+                raise
+            self.stats.latencies[stage].append((time.perf_counter() - started) * 1000)
+        if not text:
+            self.stats.failed[stage] += 1
+            raise ValueError(f"{stage} returned no text")
+        self.checkpoints.save(url, stage, text)
+        return text
+
+    async def fetch(self, url: str) -> str:
+        response = await self.http.get(url)
+        response.raise_for_status()
+        return response.text
+
+    async def extract(self, html: str) -> str:
+        # Local pre-extraction (off the event loop: parsing is CPU work), then
+        # the LLM only as an optional refinement or when nothing was found
+        text, stats = await asyncio.to_thread(pre_extract, html)
+        self.stats.tokens_saved.append(stats["tokens_saved"])
+        if text and not WEB_LLM_REFINE:
+            return text
+        return await self.respond(EXTRACT_MODEL, refine_prompt(text) if text else extract_prompt(html))
+
+    async def summarize(self, content: str) -> str:
+        # Same map-reduce as webtext.summarize_content, with the chunks of one
+        # page summarized concurrently (at most SUMMARY_PARALLELISM at a time)
+        chunks = split_into_chunks(content)
+        if len(chunks) == 1:
+            return await self.respond(SUMMARY_MODEL, summarize_prompt(content))
+        limit = asyncio.Semaphore(SUMMARY_PARALLELISM)
+
+        async def summarize_chunk(chunk: str) -> str:
+            async with limit:
+                return await self.respond(SUMMARY_MODEL, summarize_prompt(chunk))
+
+        partials = await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+        joined = "\n\n".join(partials)
+        if 1 < len(split_into_chunks(joined)) < len(partials):
+            return await self.summarize(joined)
+        return await self.respond(SUMMARY_MODEL, merge_prompt(partials))
+
+    async def respond(self, model: str, prompt: str) -> str:
+        response = await self.llm.responses.create(model=model, input=prompt)
+        return response.output_text
+
+    async def process(self, url: str) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"url": url}
+        try:
+            html = await self.run_stage(url, "fetch", lambda: self.fetch(url))
+            content = await self.run_stage(url, "extract", lambda: self.extract(html))
+            summary = await self.run_stage(url, "summarize", lambda: self.summarize(content))
+            post = await self.run_stage(url, "post", lambda: self.respond(POST_MODEL, x_post_prompt(summary)))
+            result.update(status="ok", summary=summary, post=post)
+        except (httpx.HTTPError, OpenAIError, ValueError) as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        return result
+
+
+async def run_batch(urls: List[str], output_path: str, checkpoint_dir: str = WEB_CHECKPOINT_DIR,
+                    fetch_concurrency: int = WEB_FETCH_CONCURRENCY,
+                    llm_concurrency: int = WEB_LLM_CONCURRENCY) -> Dict[str, Any]:
+    pipeline = Pipeline(Checkpoints(checkpoint_dir), fetch_concurrency, llm_concurrency)
+    started = time.perf_counter()
+    try:
+        tasks = [asyncio.create_task(pipeline.process(url)) for url in urls]
+        statuses = await write_results(tasks, output_path)
+    finally:
+        await pipeline.aclose()
+
+    return {
+        "urls": len(urls),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "statuses": statuses,
+        "stages": pipeline.stats.report()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate X posts for a list of URLs (webtext.py in batch).")
+    parser.add_argument("urls", help="file with one URL per line, or - for stdin")
+    parser.add_argument("--output", default="posts.jsonl")
+    parser.add_argument("--checkpoint-dir", default=WEB_CHECKPOINT_DIR)
+    parser.add_argument("--fetch-concurrency", type=int, default=WEB_FETCH_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, default=WEB_LLM_CONCURRENCY)
+    args = parser.parse_args()
+
+    stats = asyncio.run(run_batch(read_urls(args.urls), args.output, args.checkpoint_dir,
+                                  args.fetch_concurrency, args.llm_concurrency))
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
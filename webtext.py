@@ -1,13 +1,43 @@
-import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
 # Run "uv sync" to install the below packages
 from openai import OpenAI
 from dotenv import load_dotenv
 import requests
 
+from htmltext import extract_main_text, extraction_stats
+from observations import estimate_tokens
+from prompts import register_template, render, derived
+
 load_dotenv()
 
-client = OpenAI()
+# using gpt-4o-mini because it's great for summarization & extraction tasks (and cheap!)
+EXTRACT_MODEL = "gpt-4o-mini"
+SUMMARY_MODEL = "gpt-4o-mini"
+POST_MODEL = "gpt-4o"
+
+# The core content is extracted locally; set to 1 to also have the LLM clean it up
+WEB_LLM_REFINE = os.getenv("WEB_LLM_REFINE", "0") == "1"
+
+# Long content is summarized in chunks of at most this many tokens, in parallel
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_PARALLELISM = int(os.getenv("SUMMARY_PARALLELISM", "4"))
+
+PARAGRAPH_BREAK_RE = re.compile(r"\n\s*\n")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Created on first use, so importing the prompts (webbatch.py) needs no client
+_client = None
+
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
 
 
 def get_website_html(url: str) -> str:
@@ -20,11 +50,9 @@ def get_website_html(url: str) -> str:
         return ""
 
 
-def extract_core_website_content(html: str) -> str:
-    response = client.responses.create(
-        # using gpt-4o-mini because it's great for summarization & extraction tasks (and cheap!)
-        model="gpt-4o-mini",
-        input=f"""
+# === Prompts (shared with the batch pipeline in webbatch.py) ===
+def extract_prompt(html: str) -> str:
+    return f"""
             You are an expert web content extractor. Your task is to extract the core content from a given HTML page.
             The core content should be the main text, excluding navigation, footers, and other non-essential elements like scripts etc.
 
@@ -35,15 +63,24 @@ def extract_core_website_content(html: str) -> str:
 
             Please extract the core content and return it as plain text.
         """
-    )
 
-    return response.output_text
 
+def refine_prompt(text: str) -> str:
+    return f"""
+            You are an expert web content extractor. The text below was extracted from a web page and is mostly its main content.
+            Remove anything that is not part of the main content (leftover navigation, cookie notices, ads, sharing prompts) and fix broken line breaks.
 
-def summarize_content(content: str) -> str:
-    response = client.responses.create(
-        model="gpt-4o-mini",
-        input=f"""
+            Here is the extracted text:
+            <text>
+            {text}
+            </text>
+
+            Please return the cleaned core content as plain text, without adding anything.
+        """
+
+
+def summarize_prompt(content: str) -> str:
+    return f"""
             You are an expert summarizer. Your task is to summarize the provided content into a concise and clear summary.
 
             Here is the content to summarize:
@@ -53,30 +90,38 @@ def summarize_content(content: str) -> str:
 
             Please provide a brief summary of the main points in the content. Prefer bullet points and avoid unncessary explanations.
         """
-    )
 
-    return response.output_text
 
+def merge_prompt(partial_summaries: List[str]) -> str:
+    parts = "\n".join(f"<part-{i}>\n{p}\n</part-{i}>" for i, p in enumerate(partial_summaries, 1))
+    return f"""
+            You are an expert summarizer. The summaries below each cover one consecutive part of the same content, in order.
+            Merge them into one concise and clear summary of the whole content, removing repetition.
 
-def generate_x_post(summary: str) -> str:
-    with open("post-examples.json", "r") as f:
-        examples = json.load(f)
+            Here are the partial summaries:
+            <summaries>
+            {parts}
+            </summaries>
+
+            Please provide a brief summary of the main points in the content. Prefer bullet points and avoid unncessary explanations.
+        """
 
-    examples_str = ""
-    for i, example in enumerate(examples, 1):
-        examples_str += f"""
-        <example-{i}>
+
+POST_EXAMPLES_PATH = os.getenv("POST_EXAMPLES_PATH", "post-examples.json")
+
+EXAMPLE_TEMPLATE = register_template("x_post.example", """
+        <example-$number>
             <topic>
-            {example['topic']}
+            $topic
             </topic>
 
             <generated-post>
-            {example['post']}
+            $post
             </generated-post>
-        </example-{i}>
-        """
+        </example-$number>
+        """)
 
-    prompt = f"""
+register_template("x_post", """
         You are an expert social media manager, and you excel at crafting viral and highly engaging posts for X (formerly Twitter).
 
         Your task is to generate a post based on a short text summary.
@@ -87,25 +132,112 @@ def generate_x_post(summary: str) -> str:
 
         Here's the text summary which you should use to generate the post:
         <summary>
-        {summary}
+        $summary
         </summary>
 
         Here are some examples of topics and generated posts:
         <examples>
-            {examples_str}
+            $examples
         </examples>
 
         Please use the tone, language, structure , and style of the examples provided above to generate a post that is engaging and relevant to the topic provided by the user.
         Don't use the content from the examples!
-"""
-    response = client.responses.create(
-        model="gpt-4o",
-        input=prompt
-    )
-
+""")
+
+
+def render_post_examples(examples: List[Dict[str, str]]) -> str:
+    return "".join(EXAMPLE_TEMPLATE.substitute(number=i, topic=example["topic"], post=example["post"])
+                   for i, example in enumerate(examples, 1))
+
+
+def x_post_prompt(summary: str) -> str:
+    # The examples block is rendered once per version of post-examples.json
+    examples = derived(POST_EXAMPLES_PATH, "x_post.examples", render_post_examples)
+    return render("x_post", summary=summary, examples=examples)
+
+
+# === Chunking ===
+def split_oversized(paragraph: str, budget: int) -> List[str]:
+    # A single paragraph over budget: split on sentences, then hard-cut
+    pieces, current = [], ""
+    cut = max(1, budget - 1) * 4
+    for sentence in SENTENCE_END_RE.split(paragraph):
+        if estimate_tokens(sentence) > budget and current:
+            pieces.append(current)
+            current = ""
+        while estimate_tokens(sentence) > budget:
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:]
+        if current and estimate_tokens(current + " " + sentence) > budget:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(content: str, budget: int = SUMMARY_CHUNK_TOKENS) -> List[str]:
+    # Paragraphs are packed greedily, so chunks only break between paragraphs
+    chunks, current = [], ""
+    for paragraph in PARAGRAPH_BREAK_RE.split(content.strip()):
+        for piece in split_oversized(paragraph.strip(), budget) if estimate_tokens(paragraph) > budget else [paragraph.strip()]:
+            if current and estimate_tokens(current) + estimate_tokens(piece) > budget:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks or [content]
+
+
+# === Stages ===
+def complete(model: str, prompt: str) -> str:
+    response = get_client().responses.create(model=model, input=prompt)
     return response.output_text
 
 
+def pre_extract(html: str) -> Tuple[str, Dict[str, int]]:
+    text = extract_main_text(html)
+    return text, extraction_stats(html, text)
+
+
+def extract_core_website_content(html: str) -> str:
+    text, stats = pre_extract(html)
+    print(f"Local extraction: {stats['html_tokens']} -> {stats['text_tokens']} tokens ({stats['tokens_saved']} saved)")
+    if text and not WEB_LLM_REFINE:
+        return text
+    # Optional refinement pass; the raw HTML is only sent when nothing was found locally
+    return complete(EXTRACT_MODEL, refine_prompt(text) if text else extract_prompt(html))
+
+
+def summarize_content(content: str) -> str:
+    chunks = split_into_chunks(content)
+    if len(chunks) == 1:
+        return complete(SUMMARY_MODEL, summarize_prompt(content))  # short input: single shot
+
+    # Map: summarize the chunks in parallel (results stay in content order)
+    print(f"Summarizing {len(chunks)} chunks ({SUMMARY_PARALLELISM} at a time)...")
+    with ThreadPoolExecutor(max_workers=SUMMARY_PARALLELISM) as pool:
+        partials = list(pool.map(lambda chunk: complete(SUMMARY_MODEL, summarize_prompt(chunk)), chunks))
+    return merge_summaries(partials)
+
+
+def merge_summaries(partials: List[str]) -> str:
+    # Reduce: one merge call, or another map round if the partials are
+    # themselves still longer than one chunk (and that round makes progress)
+    joined = "\n\n".join(partials)
+    if 1 < len(split_into_chunks(joined)) < len(partials):
+        return summarize_content(joined)
+    return complete(SUMMARY_MODEL, merge_prompt(partials))
+
+
+def generate_x_post(summary: str) -> str:
+    return complete(POST_MODEL, x_post_prompt(summary))
+
+
 def main():
     website_url = input("Website URL: ")
     print("Fetching website HTML...")